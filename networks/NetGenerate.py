@@ -1,9 +1,9 @@
 import math
 import random
-
-import yaml
+import sys
 
 from resources import Settings
+from resources import NetworkFormat
 
 
 class Segment:
@@ -24,7 +24,7 @@ class Segment:
 
     @staticmethod
     def generate_border_flow():
-        return {j: int(random.random() * 5400) for j in range(0, Settings.STEPS, 3)}
+        return {j: int(random.random() * 5400) for j in range(0, Settings.get_settings().STEPS, 3)}
 
     @staticmethod
     def get_segment(segment_id):
@@ -258,8 +258,12 @@ def generate_traffic_grid(grid_size):
 
 
 def save_yaml(data, filename):
-    with open(filename, 'w') as file:
-        yaml.dump(get_yaml_representation(data), file, default_flow_style=False)
+    NetworkFormat.save_network(get_yaml_representation(data), filename)
+
+
+# format by the extension of the filename: .yml/.yaml, .json or .npz (columnar, fastest to load)
+def save_network(data, filename):
+    return NetworkFormat.save_network(get_yaml_representation(data), filename)
 
 
 def get_yaml_representation(data):
@@ -267,21 +271,24 @@ def get_yaml_representation(data):
     for segment in data:
         segment_yaml.update(segment.get_yaml_representation())
 
-    yaml_output = {Settings.YAML_OPTION: get_options(), Settings.YAML_SEGMENT: segment_yaml}
+    settings = Settings.get_settings()
+    yaml_output = {settings.YAML_OPTION: get_options(), settings.YAML_SEGMENT: segment_yaml}
     return yaml_output
 
 
 def get_options():
+    settings = Settings.get_settings()
     return {
-        Settings.YAML_OPTION_LOGGING_INTERVAL: Settings.LOGGING_INTERVAL,
-        Settings.YAML_OPTION_DURATION: Settings.STEPS,
-        Settings.YAML_OPTION_INTERVAL: Settings.INTERVAL,
-        Settings.YAML_OPTION_PERIOD: Settings.TIME_STEP
+        settings.YAML_OPTION_LOGGING_INTERVAL: settings.LOGGING_INTERVAL,
+        settings.YAML_OPTION_DURATION: settings.STEPS,
+        settings.YAML_OPTION_INTERVAL: settings.INTERVAL,
+        settings.YAML_OPTION_PERIOD: settings.TIME_STEP
     }
 
 
 if __name__ == "__main__":
-    grid_size = Settings.GRID_SIZE  # Change this to generate a larger grid
+    grid_size = Settings.get_settings().GRID_SIZE  # Change this to generate a larger grid
     traffic_grid = generate_traffic_grid(grid_size)
 
-    save_yaml(traffic_grid, 'traffic_grid.yaml')
+    # e.g. python NetGenerate.py traffic_grid.npz
+    save_network(traffic_grid, sys.argv[1] if len(sys.argv) > 1 else 'traffic_grid.yaml')
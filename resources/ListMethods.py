@@ -14,8 +14,10 @@ def __flatten_list__(_2d_list):
     return flat_list
 
 
-def __fill_slots__(param_list):
-    steps = Settings.get_settings().STEPS
+# steps: number of simulation steps, STEPS of the global settings by default
+def __fill_slots__(param_list, steps=None):
+    if steps is None:
+        steps = Settings.get_settings().STEPS
     # single value
     if not type(param_list) == list: return [param_list] * steps
 
@@ -31,10 +33,10 @@ def __fill_slots__(param_list):
     # add end value
 
     if key[len(key) - 1] > steps: raise IndexError(
-        "max given index is " + str(key[len(key) - 1]) + ", but the max step number is " + str(Settings.STEPS))
+        "max given index is " + str(key[len(key) - 1]) + ", but the max step number is " + str(steps))
     key.append(steps)
 
-    # build new list with Settings.STEP entries
+    # build new list with steps entries
     for j in range(1, len(key)):
         for i in range(key[j - 1] - 1, key[j]):
             newList[i] = values[j - 1]
@@ -0,0 +1,129 @@
+'''
+A network can be stored in three equivalent formats, chosen by the file extension:
+- .yml/.yaml: the network file format of the simulations, parsed with libyaml (CSafeLoader) if available
+- .json: same structure as the yml file
+- .npz: binary columnar description, one array per segment attribute; the predecessor, successor and
+  border flow lists are stored as flat arrays with offsets (CSR layout)
+All formats are loaded into the dictionary of the yml file {YAML_OPTION: {...}, YAML_SEGMENT: {id: {...}}, ...}.
+'''
+import json
+import os
+
+import numpy as np
+import yaml
+
+from resources import Settings
+
+# libyaml parser and emitter, about ten times faster than the pure Python ones
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+YAML_DUMPER = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+JSON_EXTENSIONS = [".json"]
+COLUMNS_EXTENSIONS = [".npz"]
+# border flow given as a single value instead of a list of {step: flow}
+SINGLE_BORDER_FLOW = -1
+# segment attributes with an own column, other attributes of a segment are stored as json
+COLUMN_ATTRIBUTES = ["name", "length", "lanes", "velocity_free", "predecessor", "successor", "border_flow"]
+
+
+def load_network(file_path):
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension in JSON_EXTENSIONS:
+        with open(file_path, "r") as file:
+            return json.load(file, object_pairs_hook=__int_keys__)
+    if extension in COLUMNS_EXTENSIONS:
+        return load_columns(file_path)
+    with open(file_path, "r") as file:
+        return yaml.load(file, Loader=YAML_LOADER)
+
+
+def save_network(network, file_path):
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension in COLUMNS_EXTENSIONS:
+        return save_columns(network, file_path)
+    with open(file_path, "w") as file:
+        if extension in JSON_EXTENSIONS:
+            json.dump(network, file)
+        else:
+            # keep the order of the segments, it is the order of the cells
+            yaml.dump(network, file, Dumper=YAML_DUMPER, default_flow_style=False, sort_keys=False)
+    return file_path
+
+
+# json keys are strings, the segment ids and border flow steps of the yml file are integers
+def __int_keys__(pairs):
+    return {int(key) if key.lstrip("-").isdigit() else key: value for key, value in pairs}
+
+
+# list of lists -> offsets, flat values
+def __flatten__(lists):
+    offsets = np.zeros(len(lists) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(values) for values in lists])
+    return offsets, np.array([value for values in lists for value in values])
+
+
+def __border_flow_pairs__(segment):
+    if "border_flow" not in segment:
+        return []
+    border_flow = segment["border_flow"]
+    if not isinstance(border_flow, list):
+        return [(SINGLE_BORDER_FLOW, border_flow)]
+    return [(step, flow) for entry in border_flow for step, flow in entry.items()]
+
+
+def save_columns(network, file_path):
+    settings = Settings.get_settings()
+    segments = list(network[settings.YAML_SEGMENT].values())
+    predecessor_offsets, predecessors = __flatten__([segment.get("predecessor") or [] for segment in segments])
+    successor_offsets, successors = __flatten__([segment.get("successor") or [] for segment in segments])
+    border_offsets, border_pairs = __flatten__([__border_flow_pairs__(segment) for segment in segments])
+    border_pairs = border_pairs.reshape(-1, 2)
+    # options, detectors and other sections are small and stored as json
+    meta = {"sections": {key: value for key, value in network.items() if key != settings.YAML_SEGMENT},
+            "has_border_flow": ["border_flow" in segment for segment in segments],
+            "attributes": {i: {key: value for key, value in segment.items() if key not in COLUMN_ATTRIBUTES}
+                           for i, segment in enumerate(segments) if not segment.keys() <= set(COLUMN_ATTRIBUTES)}}
+    np.savez(file_path,
+             meta=np.array(json.dumps(meta)),
+             segment_id=np.array(list(network[settings.YAML_SEGMENT].keys())),
+             name=np.array([str(segment.get("name", "")) for segment in segments]),
+             length=np.array([segment["length"] for segment in segments]),
+             lanes=np.array([segment["lanes"] for segment in segments]),
+             velocity_free=np.array([segment["velocity_free"] for segment in segments]),
+             predecessor_offsets=predecessor_offsets, predecessors=predecessors,
+             successor_offsets=successor_offsets, successors=successors,
+             border_offsets=border_offsets,
+             border_step=border_pairs[:, 0].astype(np.int64), border_flow=border_pairs[:, 1])
+    return file_path
+
+
+def load_columns(file_path):
+    settings = Settings.get_settings()
+    with np.load(file_path, allow_pickle=False) as data:
+        # tolist converts to Python types, as the yml parser returns them
+        columns = {name: data[name].tolist() for name in data.files if name != "meta"}
+        meta = json.loads(str(data["meta"]), object_pairs_hook=__int_keys__)
+    predecessor_offsets, successor_offsets = columns["predecessor_offsets"], columns["successor_offsets"]
+    border_offsets = columns["border_offsets"]
+
+    segments = {}
+    for i, segment_id in enumerate(columns["segment_id"]):
+        segment = {"length": columns["length"][i], "lanes": columns["lanes"][i],
+                   "velocity_free": columns["velocity_free"][i],
+                   "predecessor": columns["predecessors"][predecessor_offsets[i]:predecessor_offsets[i + 1]] or None,
+                   "successor": columns["successors"][successor_offsets[i]:successor_offsets[i + 1]] or None}
+        if columns["name"][i]:
+            segment["name"] = columns["name"][i]
+        if meta["has_border_flow"][i]:
+            steps = columns["border_step"][border_offsets[i]:border_offsets[i + 1]]
+            flows = columns["border_flow"][border_offsets[i]:border_offsets[i + 1]]
+            if steps == [SINGLE_BORDER_FLOW]:
+                segment["border_flow"] = flows[0]
+            else:
+                segment["border_flow"] = [{step: flow} for step, flow in zip(steps, flows)]
+        segment.update(meta["attributes"].get(i, {}))
+        segments[segment_id] = segment
+
+    network = {settings.YAML_SEGMENT: segments}
+    network.update(meta["sections"])
+    return network
@@ -0,0 +1,234 @@
+import json
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+HEADER_FILE = "header.json"
+CHUNK_FILE = "chunk_{:05d}.npy"
+# settings needed to interpret a result store
+HEADER_SETTINGS = ["STEPS", "INTERVAL", "TIME_STEP", "LOGGING_INTERVAL", "CAR_LENGTH", "FLOW_PER_LANE",
+                   "WAVE_COEFFICIENT"]
+
+
+class ResultStoreWriter:
+    '''
+    Writes the logged states of a simulation as binary result store:
+    a directory with time-chunked .npy blocks (rows = logged seconds) and a small json header.
+    The header holds the engine name, the settings of the run, the FIRST/LAST cell range of every segment
+    and the row range of every chunk.
+    Rows are collected until a chunk is full, so memory use is bounded by one chunk.
+    '''
+    CHUNK_BYTES = 64 * 1024 * 1024
+
+    def __init__(self, path, row_shape, engine, settings, segment_ranges, chunk_rows=None):
+        self.path = path
+        self.row_shape = tuple(row_shape)
+        row_bytes = max(1, int(np.prod(self.row_shape)) * np.dtype(np.float64).itemsize)
+        self.chunk_rows = chunk_rows or max(1, self.CHUNK_BYTES // row_bytes)
+        self.buffer = np.zeros((self.chunk_rows,) + self.row_shape)
+        self.buffer_count = 0
+        self.row_count = 0
+        self.header = {"engine": engine,
+                       "row_shape": list(self.row_shape),
+                       "dtype": "float64",
+                       "settings": {key: getattr(settings, key) for key in HEADER_SETTINGS},
+                       "segments": [[segment_id, first, last] for segment_id, (first, last) in segment_ranges.items()],
+                       "chunks": []}
+        os.makedirs(path, exist_ok=True)
+
+    # appends one or more rows (shape row_shape or n x row_shape)
+    def append(self, rows):
+        rows = np.asarray(rows, dtype=np.float64).reshape((-1,) + self.row_shape)
+        written = 0
+        while written < len(rows):
+            count = min(len(rows) - written, self.chunk_rows - self.buffer_count)
+            self.buffer[self.buffer_count:self.buffer_count + count] = rows[written:written + count]
+            self.buffer_count += count
+            written += count
+            if self.buffer_count == self.chunk_rows:
+                self.write_chunk()
+
+    def write_chunk(self):
+        if self.buffer_count == 0:
+            return
+        file_name = CHUNK_FILE.format(len(self.header["chunks"]))
+        np.save(os.path.join(self.path, file_name), self.buffer[:self.buffer_count])
+        self.header["chunks"].append([file_name, self.row_count, self.row_count + self.buffer_count])
+        self.row_count += self.buffer_count
+        self.buffer_count = 0
+
+    # writes the buffered rows and the header, the rows so far can be read with ResultStore
+    def flush(self):
+        self.write_chunk()
+        self.header["rows"] = self.row_count
+        with open(os.path.join(self.path, HEADER_FILE), "w") as file:
+            json.dump(self.header, file, indent=1)
+
+    # writes the remaining rows and the header, the store is complete afterwards
+    def close(self):
+        self.flush()
+        self.buffer = None
+        return self.path
+
+
+class StreamingResultWriter:
+    '''
+    Result sink that writes every logged state to a result store while the simulation is running.
+    put() hands a copy of the state to a background thread through a bounded queue,
+    so writing overlaps with computing the next interval and at most queue_depth states wait in memory.
+    If the queue is full, put() blocks until the writer catches up (back-pressure),
+    the number of blocked puts and the time spent waiting are reported by get_statistics().
+    '''
+    STOP = None
+
+    def __init__(self, path, engine, settings, segment_ranges, queue_depth=8, chunk_rows=None):
+        self.path = path
+        self.engine = engine
+        self.settings = settings
+        self.segment_ranges = segment_ranges
+        self.chunk_rows = chunk_rows
+        self.queue_depth = queue_depth
+        self.queue = queue.Queue(maxsize=queue_depth)
+        # the store writer is created with the shape of the first state
+        self.writer = None
+        self.error = None
+        self.put_count = 0
+        self.blocked_puts = 0
+        self.blocked_seconds = 0.0
+        self.max_queue_size = 0
+        self.write_seconds = 0.0
+        self.thread = threading.Thread(target=self.run, name="StreamingResultWriter", daemon=True)
+        self.thread.start()
+
+    def put(self, state):
+        if self.error is not None:
+            raise self.error
+        # copy, the simulation keeps updating its state vectors
+        state = np.array(state, dtype=np.float64)
+        self.put_count += 1
+        try:
+            self.queue.put_nowait(state)
+        except queue.Full:
+            start = time.perf_counter()
+            self.queue.put(state)
+            self.blocked_puts += 1
+            self.blocked_seconds += time.perf_counter() - start
+        self.max_queue_size = max(self.max_queue_size, self.queue.qsize())
+
+    # writer thread
+    def run(self):
+        while True:
+            state = self.queue.get()
+            if state is self.STOP:
+                return
+            if isinstance(state, threading.Event):  # flush()
+                self.flush_writer(state)
+                continue
+            if self.error is not None:
+                continue
+            try:
+                start = time.perf_counter()
+                if self.writer is None:
+                    self.writer = ResultStoreWriter(self.path, np.shape(state), self.engine, self.settings,
+                                                    self.segment_ranges, self.chunk_rows)
+                self.writer.append(state)
+                self.write_seconds += time.perf_counter() - start
+            except Exception as ex:
+                self.error = ex
+
+    def flush_writer(self, done):
+        try:
+            if self.error is None and self.writer is not None:
+                self.writer.flush()
+        except Exception as ex:
+            self.error = ex
+        done.set()
+
+    # waits until the queued states are written and writes the header, the rows so far can be read with ResultStore
+    def flush(self):
+        done = threading.Event()
+        self.queue.put(done)
+        done.wait()
+        if self.error is not None:
+            raise self.error
+
+    # waits for the queued states, completes the store and returns the statistics
+    def close(self):
+        self.queue.put(self.STOP)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+        if self.writer is not None:
+            self.writer.close()
+        return self.get_statistics()
+
+    def get_statistics(self):
+        return {"stream_path": self.path,
+                "stream_rows": self.put_count,
+                "stream_queue_depth": self.queue_depth,
+                "stream_max_queue_size": self.max_queue_size,
+                "stream_blocked_puts": self.blocked_puts,
+                "stream_blocked_seconds": self.blocked_seconds,
+                "stream_write_seconds": self.write_seconds}
+
+
+class ResultStore:
+    '''
+    Reads a result store written by ResultStoreWriter. The chunks are memory-mapped,
+    only the rows that are accessed are read from disk.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, HEADER_FILE), "r") as file:
+            self.header = json.load(file)
+        self.engine = self.header["engine"]
+        self.settings = self.header["settings"]
+        self.row_count = self.header["rows"]
+        self.row_shape = tuple(self.header["row_shape"])
+        self.segment_ranges = {segment_id: (first, last) for segment_id, first, last in self.header["segments"]}
+        self.chunks = [np.load(os.path.join(path, file_name), mmap_mode='r')
+                       for file_name, _, _ in self.header["chunks"]]
+        self.chunk_starts = [start for _, start, _ in self.header["chunks"]]
+
+    def __len__(self):
+        return self.row_count
+
+    def get_chunk(self, index):
+        return self.chunks[index]
+
+    # rows start <= row < stop, a view if they are in one chunk, else a copy
+    def get_rows(self, start=0, stop=None):
+        stop = self.row_count if stop is None else min(stop, self.row_count)
+        parts = []
+        for chunk, chunk_start in zip(self.chunks, self.chunk_starts):
+            chunk_stop = chunk_start + len(chunk)
+            if chunk_stop <= start or chunk_start >= stop:
+                continue
+            parts.append(chunk[max(start, chunk_start) - chunk_start:min(stop, chunk_stop) - chunk_start])
+        if not parts:
+            return np.zeros((0,) + self.row_shape)
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate(parts)
+
+    def to_array(self):
+        return self.get_rows()
+
+    # log of the cells of one segment (FIRST to LAST inclusive) over all rows
+    def get_segment(self, segment_id):
+        first, last = self.segment_ranges[segment_id]
+        if not self.chunks:
+            return np.zeros((0, last + 1 - first) + self.row_shape[1:])
+        return np.concatenate([chunk[:, first:last + 1] for chunk in self.chunks])
+
+    # explicit csv export, one line per row, ';' separated as the former csv output.
+    # Rows with more than one dimension (ensemble) are flattened.
+    def export_csv(self, csv_path):
+        with open(csv_path, "w") as file:
+            for chunk in self.chunks:
+                np.savetxt(file, np.asarray(chunk).reshape(len(chunk), -1), delimiter=';')
+        return csv_path
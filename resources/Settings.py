@@ -54,6 +54,28 @@ class _Settings:
         self.GRAPH_TYPE = "graph"
         self.PLOT_TYPE = "plot"
         self.SHOW_TYPE = self.GRAPH_TYPE
+        # storage of the vectorized state log: ram or memmap
+        self.LOG_STORAGE = "ram"
+        # rows of the vectorized state log: snapshot (state at the start of a logging interval) or average
+        self.LOG_MODE = "snapshot"
+        # write the logged states to a result store while simulating, bounded by STREAM_QUEUE_DEPTH queued states
+        self.STREAM_RESULTS = False
+        self.STREAM_QUEUE_DEPTH = 8
+        # per segment KPIs of the vectorized simulations: off, on or only (no full log)
+        self.KPI_MODE = "off"
+        # cache of the compiled networks of the vectorized simulations (RESULT_PATH/cache)
+        self.NETWORK_CACHE = True
+        # worker processes of VectorizedFlowParallel and VectorizedFlowDistributed, 0 = number of cores
+        self.PARALLEL_WORKERS = 0
+        # VectorizedFlowDistributed: steps between two halo exchanges and host of the coordinator
+        self.HALO_STEPS = 4
+        self.DISTRIBUTED_HOST = "127.0.0.1"
+        # vectorized simulations: write a checkpoint every CHECKPOINT_INTERVALS intervals, 0 = off
+        self.CHECKPOINT_INTERVALS = 0
+        # vectorized simulations: initial vehicles, "" = empty cells, "steady" = steady state of the first interval,
+        # or the path of a state snapshot (checkpoint, result store, .npy) and its row WARM_START_ROW
+        self.WARM_START = ""
+        self.WARM_START_ROW = -1
 
         # changeable Program settings.ini
         self.STEPS = 24
@@ -70,6 +92,7 @@ class _Settings:
         self.YAML_OPTION_LOGGING_INTERVAL = "Loggingintervall"
         self.YAML_SEGMENT = "Segmente"
         self.YAML_OPTION = "Optionen"
+        self.YAML_DETECTOR = "Detektoren"
 
         self.__import_settings__()
 
@@ -98,6 +121,19 @@ class _Settings:
             self.SAVE_PLOTS = config["program_settings"]["SAVE_PLOTS"] == "True"
             self.SHOW_PLOTS = config["program_settings"]["SHOW_PLOTS"] == "True"
             self.SHOW_TYPE = config["program_settings"]["SHOW_TYPE"]
+            self.LOG_STORAGE = config["program_settings"].get("LOG_STORAGE", self.LOG_STORAGE)
+            self.LOG_MODE = config["program_settings"].get("LOG_MODE", self.LOG_MODE)
+            self.STREAM_RESULTS = config["program_settings"].get("STREAM_RESULTS", str(self.STREAM_RESULTS)) == "True"
+            self.STREAM_QUEUE_DEPTH = int(config["program_settings"].get("STREAM_QUEUE_DEPTH", self.STREAM_QUEUE_DEPTH))
+            self.KPI_MODE = config["program_settings"].get("KPI_MODE", self.KPI_MODE)
+            self.NETWORK_CACHE = config["program_settings"].get("NETWORK_CACHE", str(self.NETWORK_CACHE)) == "True"
+            self.PARALLEL_WORKERS = int(config["program_settings"].get("PARALLEL_WORKERS", self.PARALLEL_WORKERS))
+            self.HALO_STEPS = int(config["program_settings"].get("HALO_STEPS", self.HALO_STEPS))
+            self.DISTRIBUTED_HOST = config["program_settings"].get("DISTRIBUTED_HOST", self.DISTRIBUTED_HOST)
+            self.CHECKPOINT_INTERVALS = int(config["program_settings"].get("CHECKPOINT_INTERVALS",
+                                                                           self.CHECKPOINT_INTERVALS))
+            self.WARM_START = config["program_settings"].get("WARM_START", self.WARM_START)
+            self.WARM_START_ROW = int(config["program_settings"].get("WARM_START_ROW", self.WARM_START_ROW))
         if config.has_section("sim_constants"):
             self.CAR_LENGTH = int(config["sim_constants"]["CAR_LENGTH"])
             self.FLOW_PER_LANE = int(config["sim_constants"]["FLOW_PER_LANE"])
@@ -109,6 +145,7 @@ class _Settings:
             self.YAML_OPTION_LOGGING_INTERVAL = config["key_constants"]["YAML_OPTION_LOGGING_INTERVAL"]
             self.YAML_SEGMENT = config["key_constants"]["YAML_SEGMENT"]
             self.YAML_OPTION = config["key_constants"]["YAML_OPTION"]
+            self.YAML_DETECTOR = config["key_constants"].get("YAML_DETECTOR", self.YAML_DETECTOR)
     def set_settings(self, dict : dict):
         for key, value in dict.items():
             setattr(self, key, value)
@@ -121,6 +158,36 @@ def get_settings():
         settings = _Settings()
     return settings
 
+
+class SimulationConfig:
+    '''
+    Immutable settings of one simulation: a copy of the given settings (the global settings by default)
+    with the given changes, e.g. the options of the yml file. Every simulation gets its own config,
+    so simulations with different settings can exist in the same process.
+    '''
+
+    def __init__(self, base=None, **changes):
+        if isinstance(base, dict):
+            values = dict(base)
+        else:
+            values = dict(vars(base if base is not None else get_settings()))
+        values.update(changes)
+        # __setattr__ is blocked
+        self.__dict__.update(values)
+
+    def __setattr__(self, key, value):
+        raise AttributeError(f"SimulationConfig is immutable, use replace({key}=...)")
+
+    def __delattr__(self, key):
+        raise AttributeError("SimulationConfig is immutable")
+
+    # copy with the given settings changed
+    def replace(self, **changes):
+        return SimulationConfig(self, **changes)
+
+    def __reduce__(self):
+        return SimulationConfig, (dict(vars(self)),)
+
 #The following files were used for the benchmark. To use this variable change the call of the file in the simulation file.
 #SIM_FILE = "..\\networks\\medium.yml"
 #SIM_FILE = "..\\networks\\small.yml"
@@ -1,12 +1,14 @@
 from resources import Settings
-import yaml
+from resources import NetworkFormat
 import logging
 class NetworkYAMLImport:
-    def __init__(self, file_path):
+    # config: SimulationConfig the options of the file are applied to, a copy of the global settings by default
+    def __init__(self, file_path, config=None):
         self.file_path = file_path
-        self.settings = Settings.get_settings()
+        self.settings = config if config is not None else Settings.SimulationConfig()
         self.options = None
         self.segments = None
+        self.detectors = None
 
     def import_file(self):
         self.__load_yaml__()
@@ -15,14 +17,15 @@ class NetworkYAMLImport:
 
     def __load_yaml__(self):
         try:
-            with open(self.file_path, "r") as file:
-                yaml_input = yaml.safe_load(file)
+            # yml, json or columnar npz network, see NetworkFormat
+            yaml_input = NetworkFormat.load_network(self.file_path)
         except FileNotFoundError:
             logging.error(f"File {self.file_path} not found.")
             return
 
         self.__set_segments__(yaml_input)
         self.__set_options__(yaml_input)
+        self.__set_detectors__(yaml_input)
 
 
     def __set_segments__(self, yaml_input):
@@ -44,15 +47,27 @@ class NetworkYAMLImport:
         except KeyError:
             logging.error(f"No options given in {self.file_path}.")
             return
+    # detectors are optional
+    def __set_detectors__(self, yaml_input):
+        self.detectors = yaml_input.get(self.settings.YAML_DETECTOR) or {}
+
     def __set_settings__(self):
         settings_dict = {"INTERVAL": self.options[self.settings.YAML_OPTION_INTERVAL],
                             "STEPS": self.options[self.settings.YAML_OPTION_DURATION],
                             "TIME_STEP": self.options[self.settings.YAML_OPTION_PERIOD],
                             "LOGGING_INTERVAL": self.options[self.settings.YAML_OPTION_LOGGING_INTERVAL]}
-        self.settings.set_settings(settings_dict)
+        self.settings = self.settings.replace(**settings_dict)
+
+    # config of the simulation of the file: the given config with the options of the file
+    def get_config(self):
+        return self.settings
+
     def get_segments(self):
         return self.segments
 
+    def get_detectors(self):
+        return self.detectors
+
     def __get_options__(self):
         return self.options
 
@@ -1,13 +1,24 @@
 import enum
 import linecache
 import logging
+import os
 import sys
 import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
 import yaml
 from traffic.oo.networkseq import NetworkSeq
 from traffic.vector.vector_flow import VectorizedFlow
+from traffic.vector.vector_numba import VectorizedFlowNumba
+from traffic.vector.vector_inplace import VectorizedFlowInPlace
+from traffic.vector.vector_parallel import VectorizedFlowParallel
+from traffic.vector.vector_distributed import VectorizedFlowDistributed
+from traffic.vector.compiled_network import CompiledNetwork
 from traffic.SimulationInterface import SimulationInterface
 
+from resources import Settings
 from resources.YAMLImport import NetworkYAMLImport
 
 
@@ -15,6 +26,10 @@ class SimulationType(enum.Enum):
     # VECTORIZED_FULL_MATRIX = VectorFullMatrix
     # VECTORIZED_SPARSE_MATRIX = VectorSparse
     VECTORIZED_VEC_FLOW = VectorizedFlow
+    VECTORIZED_NUMBA = VectorizedFlowNumba
+    VECTORIZED_IN_PLACE = VectorizedFlowInPlace
+    VECTORIZED_PARALLEL = VectorizedFlowParallel
+    VECTORIZED_DISTRIBUTED = VectorizedFlowDistributed
     SEQUENTIAL = NetworkSeq
 
     # PARALLEL = NetworkPar
@@ -88,13 +103,48 @@ class SimulationHandler:
     def get_all_simulated():
         return SimulationHandler.all_simulated
 
+    # network_cache: dictionary cache key -> CompiledNetwork, to reuse compiled networks in memory (sweeps)
+    # config: SimulationConfig the options of the yml file are applied to, a copy of the global settings by default
     @staticmethod
-    def pre_simulation(simulation_interface: SimulationInterface, yaml_file_path: str):
+    def pre_simulation(simulation_interface: SimulationInterface, yaml_file_path: str, network_cache=None,
+                       config=None):
         logging.info(f"Preparing simulation with {simulation_interface.get_name()}")
-        segments = NetworkYAMLImport(yaml_file_path).import_file()
-
-
-        ctm_simulation = simulation_interface(segments)
+        settings = config if config is not None else Settings.SimulationConfig()
+        cache_key = None
+        cache_path = None
+        network = None
+        if simulation_interface.COMPILED_NETWORK and (settings.NETWORK_CACHE or network_cache is not None):
+            cache_key = CompiledNetwork.get_cache_key(yaml_file_path, settings)
+        if cache_key and settings.NETWORK_CACHE:
+            cache_path = CompiledNetwork.get_cache_path(yaml_file_path, settings)
+
+        if network_cache is not None and cache_key in network_cache:
+            network = network_cache[cache_key]
+        elif cache_path and os.path.exists(cache_path):
+            logging.info(f"Loading compiled network {cache_path}")
+            network = CompiledNetwork.load(cache_path)
+
+        if network is not None:
+            ctm_simulation = simulation_interface(network, network.get_config(settings))
+            detectors = network.detectors
+        else:
+            network_import = NetworkYAMLImport(yaml_file_path, settings)
+            segments = network_import.import_file()
+            ctm_simulation = simulation_interface(segments, network_import.get_config())
+            detectors = network_import.get_detectors()
+            if cache_key:
+                network = CompiledNetwork.from_simulation(ctm_simulation, ctm_simulation.settings, detectors)
+            if cache_path:
+                network.save(cache_path)
+                logging.info(f"Saved compiled network {cache_path}")
+        if network_cache is not None and network is not None:
+            network_cache[cache_key] = network
+        # before the detectors and the result stream, the warm start resets the simulation
+        if settings.WARM_START:
+            ctm_simulation.warm_start(settings.WARM_START, settings.WARM_START_ROW)
+        ctm_simulation.set_detectors(detectors)
+        if settings.STREAM_RESULTS:
+            ctm_simulation.stream_results(settings.STREAM_QUEUE_DEPTH)
         return ctm_simulation
 
     @staticmethod
@@ -103,8 +153,32 @@ class SimulationHandler:
 
     @staticmethod
     def post_simulation(ctm_simulation: SimulationInterface):
-        pass
+        if statistics := ctm_simulation.get_run_statistics():
+            logging.info(f"Run statistics of {ctm_simulation.get_name()}: {statistics}")
 
+    # runs the jobs (yaml file path, SimulationType, settings overrides) on a ProcessPoolExecutor and
+    # yields their results as they complete, see run_sweep_job()
+    @staticmethod
+    def iter_sweep(jobs: list, max_workers=None, return_log=False):
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(run_sweep_job, index, yaml_file_path, SimulationType(simulation_type).name,
+                                       dict(overrides or {}), return_log)
+                       for index, (yaml_file_path, simulation_type, overrides) in enumerate(jobs)]
+            for future in as_completed(futures):
+                result = future.result()
+                if result["error"]:
+                    logging.error(f"Job {result['job']} ({result['network']}, {result['simulation']}) failed: "
+                                  f"{result['error']}")
+                else:
+                    logging.info(f"Job {result['job']} ({result['network']}, {result['simulation']}) finished in "
+                                 f"{result['simulation_time']:.2f} seconds")
+                yield result
+
+    # results of all jobs, in the order of the jobs
+    @staticmethod
+    def exec_sweep(jobs: list, max_workers=None, return_log=False):
+        results = list(SimulationHandler.iter_sweep(jobs, max_workers, return_log))
+        return sorted(results, key=lambda result: result["job"])
 
     @staticmethod
     def print_exception():
@@ -115,3 +189,37 @@ class SimulationHandler:
         linecache.checkcache(filename)
         line = linecache.getline(filename, lineno, f.f_globals)
         logging.error(f"EXCEPTION IN ({filename}, LINE {lineno} '{line.strip()}'): {exc_obj}")
+
+
+# compiled networks of the sweep jobs of this process, reused by all jobs of a worker with the same network
+sweep_networks = {}
+
+
+def run_sweep_job(index, yaml_file_path, simulation_type_name, overrides, return_log):
+    '''
+    Runs one job of SimulationHandler.iter_sweep() in a worker process.
+    The overrides (settings name -> value) are applied to the config of the simulation,
+    the options of the yml file are applied afterwards as in every simulation.
+    Returns the KPIs, the run statistics, the build and simulation times and, if return_log is set, the log.
+    '''
+    result = {"job": index, "network": yaml_file_path, "simulation": simulation_type_name, "overrides": overrides,
+              "build_time": None, "simulation_time": None, "network_reused": False, "kpis": None,
+              "run_statistics": {}, "log": None, "error": None}
+    try:
+        config = Settings.SimulationConfig(**overrides)
+        simulation_class = SimulationType[simulation_type_name].get_simulation_class()
+        network_count = len(sweep_networks)
+        start = time.time()
+        ctm_simulation = SimulationHandler.pre_simulation(simulation_class, yaml_file_path, sweep_networks, config)
+        result["build_time"] = time.time() - start
+        result["network_reused"] = simulation_class.COMPILED_NETWORK and len(sweep_networks) == network_count
+        start = time.time()
+        ctm_simulation.simulate()
+        result["simulation_time"] = time.time() - start
+        result["kpis"] = ctm_simulation.get_kpis() if hasattr(ctm_simulation, "get_kpis") else None
+        result["run_statistics"] = ctm_simulation.get_run_statistics()
+        if return_log:
+            result["log"] = np.asarray(ctm_simulation.get_results_np())
+    except Exception:
+        result["error"] = traceback.format_exc()
+    return result
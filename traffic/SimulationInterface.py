@@ -11,11 +11,15 @@ class SimulationInterface:
     SUCCESSORS = "successors"
     LANES = "lanes"
     VEHICLES = "vehicles"
+    # the simulation can be created from a compiled network (traffic.vector.compiled_network)
+    COMPILED_NETWORK = False
 
-    def __init__(self, segments):
+    # config: SimulationConfig of this simulation, a copy of the global settings by default
+    def __init__(self, segments, config=None):
         self.results_np = None
         self.results_dict = {}
-        self.settings = Settings.get_settings()
+        self.run_statistics = {}
+        self.settings = config if config is not None else Settings.SimulationConfig()
         self.import_yaml_network(segments)
 
     @abstractmethod
@@ -58,6 +62,35 @@ class SimulationInterface:
     def get_segments(self):
         pass
 
+    '''
+    returns a lazy view of the results (traffic.vector.results.Results) with
+    segment(id), timestep(t), segment_totals() and segment_occupancy()
+    '''
+    def get_results(self):
+        return None
+
+    # prepares a new run on the same network: initial_state (vehicles per cell) and border_flow
+    # ({segment_id: border_flow} as in the yml file) replace the ones of the network
+    def reset(self, initial_state=None, border_flow=None):
+        logging.warning(f"{self.get_name()} does not support reset(), create a new simulation for the next run.")
+
+    # starts with the vehicles of a previous run's state snapshot or of the steady state of the first interval
+    def warm_start(self, source, row=-1):
+        logging.warning(f"{self.get_name()} does not support warm starts, it starts with empty cells.")
+
+    # writes every logged state to a result store while simulating (resources.ResultStore.StreamingResultWriter)
+    def stream_results(self, queue_depth=8):
+        logging.warning(f"{self.get_name()} does not support streaming results.")
+
+    # virtual detectors of the yml file: {name: {segment, offset, interval}}
+    def set_detectors(self, detectors_yaml):
+        if detectors_yaml:
+            logging.warning(f"{self.get_name()} does not support detectors.")
+
+    # statistics of the last run, e.g. back-pressure of the streaming result writer
+    def get_run_statistics(self):
+        return self.run_statistics
+
     @staticmethod
     def get_name():
         return "SimulationInterface"
@@ -9,6 +9,7 @@ from PyQt5.QtWidgets import QApplication, QTabWidget, QVBoxLayout, QWidget
 import numpy as np
 
 from resources import Settings, ListMethods
+from resources.ResultStore import ResultStoreWriter
 
 
 def mid(a, b, c):
@@ -27,12 +28,13 @@ def flatten(lst):
 
 class Cell:
 
+    # settings: config of the simulation (resources.Settings.SimulationConfig), the global settings by default
     def __init__(self, cell_id, length, velocity_free, lanes = 3, wave_coef= Settings.get_settings().WAVE_COEFFICIENT,
-                 vehicle_number=0.0):
-        self.settings = Settings.get_settings()
+                 vehicle_number=0.0, settings=None):
+        self.settings = settings if settings is not None else Settings.get_settings()
         self.id = cell_id  # address of cell
         self.length = length  # length of cell in m
-        self.lanes = ListMethods.__fill_slots__(lanes)  # number of lanes for every timestep
+        self.lanes = ListMethods.__fill_slots__(lanes, self.settings.STEPS)  # number of lanes for every timestep
         self.lane = self.lanes[0]
         self.max_vehicle = length * self.lane / self.settings.CAR_LENGTH  # number of vehicle that fit in the cell, 6m is the length of a car
         self.velocity_free = velocity_free / 3.6  # free traffic velocity of vehicle
@@ -116,7 +118,7 @@ class Cell:
 class BorderInCell(Cell):
     def __init__(self, border_flow, **kwargs):
         super().__init__(**kwargs)
-        self.border_flow = ListMethods.__fill_slots__(border_flow)
+        self.border_flow = ListMethods.__fill_slots__(border_flow, self.settings.STEPS)
         self.flow_in = min(self.border_flow[0] / 3600, self.max_flow)
         self.flow = self.get_flow()
 
@@ -239,10 +241,9 @@ class DivergeLink(Link):
 
 
 class Segment:
-    segments = {}
 
-    def __init__(self, id, predecessors, successors):
-        self.settings = Settings.get_settings()
+    def __init__(self, id, predecessors, successors, settings=None):
+        self.settings = settings if settings is not None else Settings.get_settings()
         self.first_cell: Cell
         self.last_cell: Cell
         self.cells = []
@@ -254,18 +255,14 @@ class Segment:
             self.predecessors = list(predecessors)
         if successors:
             self.successors = list(successors)
-        Segment.segments[id] = self
         #print(f"Segment {id} {predecessors} {successors}")
 
+    # segments: {segment_id: Segment} of a network (NetworkSeq.segment_dict)
     @staticmethod
-    def get_segment(id):
-        return Segment.segments[id]
-
-    @staticmethod
-    def plot_every_segment():
+    def plot_every_segment(segments):
         app = QApplication([])
         tabs = QTabWidget()
-        for segment in Segment.segments.values():
+        for segment in segments.values():
             fig = segment.plot_heatmap_timesteps()
             canvas = FigureCanvas(fig)
             tab = QWidget()
@@ -277,28 +274,51 @@ class Segment:
         app.exec_()
 
     @staticmethod
-    def save_log():
+    def get_log_path():
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         # get current working directory
         subdirectory = 'oo/'  # specify the subdirectory
         directory = os.path.join(os.getcwd(), Settings.get_settings().RESULT_PATH + subdirectory)
         os.makedirs(directory, exist_ok=True)
-        csv_path = os.path.join(directory, f'{timestamp}.csv')
-        print(f"Saving results to {csv_path}")
-        array = np.empty([])
-
-        for segment in Segment.segments.values():
-            for cell in segment.cells:
-
-                response = cell.get_log_vehicles_abs()
-                # con = np.concatenate((np.array(cell.id), np.array(response)), axis=0)
-                if array.size == 1:
-                    array = np.array(response)
-                else:
-                    array = np.vstack((array, response))
-
-        np.savetxt(csv_path, np.transpose(array), delimiter=';')
-        print(f"Saved results to {csv_path}")
+        return os.path.join(directory, timestamp)
+
+    # vehicle log of all cells, rows are the logged timesteps, columns the cells in segment order
+    @staticmethod
+    def get_log_array(segments):
+        return np.transpose(np.array([cell.get_log_vehicles_abs()
+                                      for segment in segments.values() for cell in segment.cells]))
+
+    # FIRST/LAST column of every segment in get_log_array()
+    @staticmethod
+    def get_segment_ranges(segments):
+        segment_ranges = {}
+        index = 0
+        for segment in segments.values():
+            segment_ranges[segment.segment_id] = (index, index + len(segment.cells) - 1)
+            index += len(segment.cells)
+        return segment_ranges
+
+    # saves the log as binary result store (resources.ResultStore)
+    @staticmethod
+    def save_log(segments, settings=None):
+        store_path = Segment.get_log_path()
+        print(f"Saving results to {store_path}")
+        array = Segment.get_log_array(segments)
+        writer = ResultStoreWriter(store_path, array.shape[1:], "Object Orientation Sequential",
+                                   settings if settings is not None else Settings.get_settings(),
+                                   Segment.get_segment_ranges(segments))
+        writer.append(array)
+        writer.close()
+        print(f"Saved results to {store_path}")
+        return store_path
+
+    @staticmethod
+    def export_log_csv(segments):
+        csv_path = Segment.get_log_path() + ".csv"
+        print(f"Exporting results to {csv_path}")
+        np.savetxt(csv_path, Segment.get_log_array(segments), delimiter=';')
+        print(f"Exported results to {csv_path}")
+        return csv_path
 
     def plot_heatmap_timesteps(self):
 
@@ -6,80 +6,90 @@ from traffic.SimulationInterface import SimulationInterface
 from traffic.oo.cell_transmission_model import Cell, BorderInCell, Link, MergeLink, DivergeLink, Segment, BorderOutCell, \
     flatten
 from resources import Settings
+from resources.ResultStore import StreamingResultWriter
 import logging
 
 
 # Network class for sequential simulation
 class NetworkSeq(SimulationInterface):
-    counter_cells = -1
 
     # function to get the next id of the cells
-    @staticmethod
-    def get_next_id():
-        NetworkSeq.counter_cells += 1
-        return NetworkSeq.counter_cells
+    def get_next_id(self):
+        self.counter_cells += 1
+        return self.counter_cells
 
-    def __init__(self, yaml_input):
+    def __init__(self, yaml_input, config=None):
+        self.settings = config if config is not None else Settings.SimulationConfig()
+        self.counter_cells = -1
         self.results = {}
         self.cells = []
         self.links = []
         self.segments = []
+        # {segment_id: Segment} of this network
+        self.segment_dict = {}
         self.border_cells = []
         self.second_simulate = 0
-        self.timesteps_to_simulate = Settings.STEPS * Settings.INTERVAL
+        self.timesteps_to_simulate = self.settings.STEPS * self.settings.INTERVAL
         self.simstep = 0
+        self.run_statistics = {}
+        self.result_sink = None
         self.import_yaml_network(yaml_input)
 
+    def get_segment(self, id):
+        return self.segment_dict[id]
+
     # function to build the links between the segments
     def build_links(self):
         links = []
         for segment in self.segments:
             if segment.predecessors and len(segment.predecessors) == 2:
-                links.append(MergeLink(Segment.get_segment(segment.predecessors[0]).last_cell,
+                links.append(MergeLink(self.get_segment(segment.predecessors[0]).last_cell,
                                        segment.first_cell,
-                                       Segment.get_segment(segment.predecessors[1]).last_cell,
+                                       self.get_segment(segment.predecessors[1]).last_cell,
                                        0.50,
                                        0.50
                                        ))
             if segment.successors and len(segment.successors) == 2:
                 links.append(DivergeLink(segment.last_cell,
-                                         Segment.get_segment(segment.successors[0]).first_cell,
-                                         Segment.get_segment(segment.successors[1]).first_cell,
+                                         self.get_segment(segment.successors[0]).first_cell,
+                                         self.get_segment(segment.successors[1]).first_cell,
                                          0.50,
                                          0.50
                                          )
                              )
             if segment.successors and len(segment.successors) == 1 and len(
-                    Segment.get_segment(segment.successors[0]).predecessors) == 1:
-                links.append(Link(segment.last_cell, Segment.get_segment(segment.successors[0]).first_cell))
+                    self.get_segment(segment.successors[0]).predecessors) == 1:
+                links.append(Link(segment.last_cell, self.get_segment(segment.successors[0]).first_cell))
         return links
 
     # function use to create the cells of a segment
     def create_segment_cells(self, id, values: dict):
         predecessor = values.pop("predecessor")
         successor = values.pop("successor")
-        segment = Segment(id, predecessors=predecessor, successors=successor)
+        segment = Segment(id, predecessors=predecessor, successors=successor, settings=self.settings)
+        self.segment_dict[id] = segment
         cells = []
         segment_length = values.pop("length")
         if "name" in values.keys():
             values.pop("name")  # just for human readability in generated yaml files
         velo_free = values["velocity_free"]
-        cell_length = (velo_free / 3.6) * Settings.TIME_STEP
+        cell_length = (velo_free / 3.6) * self.settings.TIME_STEP
         cell_count = int(math.ceil(segment_length / cell_length))
 
         first: Cell
+        values["settings"] = self.settings
 
         if not predecessor:
-            first = BorderInCell(cell_id=NetworkSeq.get_next_id(), length=cell_length, **values)
+            first = BorderInCell(cell_id=self.get_next_id(), length=cell_length, **values)
             self.border_cells.append(first)
             values.pop("border_flow")
         else:
-            first = Cell(cell_id=NetworkSeq.get_next_id(), length=cell_length, **values)
+            first = Cell(cell_id=self.get_next_id(), length=cell_length, **values)
         segment.first_cell = first
         cells.append(segment.first_cell)
         prev = first
         for i in range(1, cell_count - 1):
-            cell = Cell(cell_id=NetworkSeq.get_next_id(), length=cell_length, **values)
+            cell = Cell(cell_id=self.get_next_id(), length=cell_length, **values)
             cells.append(cell)
             self.links.append(Link(prev, cell))
             prev = cell
@@ -87,9 +97,9 @@ class NetworkSeq(SimulationInterface):
         # last cell
         if not successor:
             # BorderOutCell
-            cell = BorderOutCell(cell_id=NetworkSeq.get_next_id(), length=cell_length, **values)
+            cell = BorderOutCell(cell_id=self.get_next_id(), length=cell_length, **values)
         else:
-            cell = Cell(cell_id=NetworkSeq.get_next_id(), length=cell_length, **values)
+            cell = Cell(cell_id=self.get_next_id(), length=cell_length, **values)
         self.links.append(Link(prev, cell))
         cells.append(cell)
         segment.last_cell = cell
@@ -122,8 +132,9 @@ class NetworkSeq(SimulationInterface):
                                                  }
         return sorted(segments_dict.items())
 
+    # yaml_input: the segments of the yml file (NetworkYAMLImport.import_file()) or the whole yml file
     def import_yaml_network(self, yaml_input):
-        yaml_segments = yaml_input[Settings.YAML_SEGMENT]
+        yaml_segments = yaml_input.get(self.settings.YAML_SEGMENT, yaml_input)
         if (yaml_segments):
             all_segments = []
             isconverted = False
@@ -145,21 +156,31 @@ class NetworkSeq(SimulationInterface):
     # function use to simulate the network
     def simulate(self):
         while self.second_simulate < self.timesteps_to_simulate:
-            if self.second_simulate % Settings.INTERVAL == 0:
+            if self.second_simulate % self.settings.INTERVAL == 0:
                 self.simstep += 1
                 print("Simulating t = ", self.simstep)
                 var2 = list(map(lambda cell: cell.next_simstep(self.simstep), self.cells))
-            if self.second_simulate % Settings.LOGGING_INTERVAL == 0:
-                var3 = list(
-                    map(lambda cell: cell.log_timestep(self.second_simulate / Settings.LOGGING_INTERVAL), self.cells))
+            if self.second_simulate % self.settings.LOGGING_INTERVAL == 0:
+                var3 = list(map(lambda cell: cell.log_timestep(self.second_simulate / self.settings.LOGGING_INTERVAL),
+                                self.cells))
+                if self.result_sink is not None:
+                    self.result_sink.put([cell.vehicle_number for cell in self.cells])
 
             # var2 = list(map(lambda cell: cell.log_timestep(self.second_simulate), self.cells))
             linkflow = list(map(lambda link: link.calc_flows(), self.links))
             linkvehi = list(map(lambda cell: cell.alter_vehicles(), self.cells))
 
-            self.second_simulate += Settings.TIME_STEP
+            self.second_simulate += self.settings.TIME_STEP
+        if self.result_sink is not None:
+            self.run_statistics.update(self.result_sink.close())
+            self.result_sink = None
         print("Simulation finished!")
 
+    # streams the vehicle numbers of all cells at every logging interval to a result store
+    def stream_results(self, queue_depth=8):
+        self.result_sink = StreamingResultWriter(Segment.get_log_path(), self.get_name(), self.settings,
+                                                 Segment.get_segment_ranges(self.segment_dict), queue_depth)
+
     @staticmethod
     def get_name():
         return "Object Orientation Sequential"
@@ -169,14 +190,14 @@ class NetworkSeq(SimulationInterface):
 
 
 # This function plots the results
-def show_results():
-    Segment.plot_every_segment()
+def show_results(network: NetworkSeq):
+    Segment.plot_every_segment(network.segment_dict)
 
 
-def save_result_plot():
-    if Settings.SHOW_PLOTS:  # if plots are shown, they are saved while showing
+def save_result_plot(network: NetworkSeq):
+    if network.settings.SHOW_PLOTS:  # if plots are shown, they are saved while showing
         return
-    for segment in Segment.segments.values():
+    for segment in network.segment_dict.values():
         fig = segment.plot_heatmap_timesteps()
 
 
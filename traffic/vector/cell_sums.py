@@ -0,0 +1,46 @@
+import numpy as np
+
+
+class CellSums:
+    '''
+    Running sums of the vehicles and the outflow (flow to the successors + flow out of the network)
+    of every cell over the steps since the last reset. The sums are updated in place.
+    The simulation keeps one CellSums updated after every step and adds it at every boundary to the
+    consumers (SegmentKPIs, averaged log), so a step costs one update however many consumers exist.
+    '''
+
+    def __init__(self, state_shape):
+        self.vehicle_sum = np.zeros(state_shape)
+        self.outflow_sum = np.zeros(state_shape)
+        self.step_count = 0
+
+    # adds the state after one step
+    def accumulate(self, cells, flow, border_exit):
+        np.add(self.vehicle_sum, cells, out=self.vehicle_sum)
+        np.add(self.outflow_sum, flow, out=self.outflow_sum)
+        np.add(self.outflow_sum, border_exit, out=self.outflow_sum)
+        self.step_count += 1
+
+    # for engines that add to vehicle_sum and outflow_sum themselves (e.g. in a compiled kernel)
+    def add_steps(self, step_count):
+        self.step_count += step_count
+
+    def add(self, other):
+        np.add(self.vehicle_sum, other.vehicle_sum, out=self.vehicle_sum)
+        np.add(self.outflow_sum, other.outflow_sum, out=self.outflow_sum)
+        self.step_count += other.step_count
+
+    def reset(self):
+        self.vehicle_sum.fill(0.0)
+        self.outflow_sum.fill(0.0)
+        self.step_count = 0
+
+    # arrays of a checkpoint (VectorCTM.checkpoint)
+    def get_state(self):
+        return {"vehicle_sum": self.vehicle_sum, "outflow_sum": self.outflow_sum,
+                "step_count": np.array(self.step_count)}
+
+    def set_state(self, state):
+        self.vehicle_sum[...] = state["vehicle_sum"]
+        self.outflow_sum[...] = state["outflow_sum"]
+        self.step_count = int(state["step_count"])
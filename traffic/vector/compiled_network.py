@@ -0,0 +1,105 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import scipy.sparse as sparse
+
+from traffic.vector.topology import NetworkTopology
+
+# increase if the content of the compiled network changes, old cache files are not used anymore
+CACHE_VERSION = 1
+# settings from settings.ini, which change the compiled network of the same yml file
+KEY_SETTINGS = ["CAR_LENGTH", "FLOW_PER_LANE", "WAVE_COEFFICIENT", "YAML_OPTION_PERIOD", "YAML_OPTION_INTERVAL",
+                "YAML_OPTION_DURATION", "YAML_OPTION_LOGGING_INTERVAL", "YAML_SEGMENT", "YAML_OPTION", "YAML_DETECTOR"]
+# settings from the options of the yml file, restored when a compiled network is loaded
+OPTION_SETTINGS = ["STEPS", "INTERVAL", "TIME_STEP", "LOGGING_INTERVAL"]
+# vectors of a vectorized simulation after import_yaml_network (veh/h already converted to veh/s)
+NETWORK_VECTORS = ["cells", "lanes", "velo", "max_flow", "max_veh", "delta", "send", "receive", "flow",
+                   "border_cells", "border_flow"]
+TOPOLOGY_PREFIX = "topology_"
+
+
+class CompiledNetwork:
+    '''
+    A network of a yml file compiled for the vectorized simulations: the parameter vectors,
+    the CSR adjacent matrix, the NetworkTopology (link masks, merge/diverge index arrays), the segment_map,
+    the options of the yml file and the detectors.
+    It is stored as .npz file, whose name is a hash of the yml file and the settings that change the result,
+    so the yml file only has to be parsed and compiled once.
+    '''
+
+    def __init__(self, arrays, segment_map, options, detectors):
+        self.arrays = arrays
+        self.segment_map = segment_map
+        self.options = options
+        self.detectors = detectors
+
+    @staticmethod
+    def get_cache_key(yaml_file_path, settings):
+        key = hashlib.sha256()
+        with open(yaml_file_path, "rb") as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                key.update(block)
+        key_settings = {name: getattr(settings, name) for name in KEY_SETTINGS}
+        key.update(json.dumps([CACHE_VERSION, key_settings], sort_keys=True).encode())
+        return key.hexdigest()
+
+    @staticmethod
+    def get_cache_path(yaml_file_path, settings):
+        directory = os.path.join(os.getcwd(), settings.RESULT_PATH + 'cache/')
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, CompiledNetwork.get_cache_key(yaml_file_path, settings) + ".npz")
+
+    # compiled network of a simulation that was created from the yml file, before it is simulated.
+    # The arrays are copies, the simulation changes its state vectors in place while the network stays cached
+    @staticmethod
+    def from_simulation(simulation, settings, detectors):
+        arrays = {name: np.array(getattr(simulation, name)) for name in NETWORK_VECTORS}
+        adjacent_matrix = sparse.csr_matrix(simulation.adjacent_matrix)
+        arrays["adjacent_data"] = np.array(adjacent_matrix.data)
+        arrays["adjacent_indices"] = np.array(adjacent_matrix.indices)
+        arrays["adjacent_indptr"] = np.array(adjacent_matrix.indptr)
+        arrays["adjacent_shape"] = np.array(adjacent_matrix.shape)
+        topology = simulation.get_topology()
+        for name, value in vars(topology).items():
+            arrays[TOPOLOGY_PREFIX + name] = np.array(value)
+        segment_map = {key: dict(segment) for key, segment in simulation.segment_map.items()}
+        options = {name: getattr(settings, name) for name in OPTION_SETTINGS}
+        return CompiledNetwork(arrays, segment_map, options, detectors or {})
+
+    def save(self, path):
+        # json keys are strings, so the segment_map is stored as list of (key, segment)
+        meta = {"segment_map": list(self.segment_map.items()), "options": self.options,
+                "detectors": self.detectors}
+        # written under a temporary name of this process and renamed, concurrent writers or a killed process
+        # never leave a truncated cache file
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as file:
+            np.savez(file, meta=np.array(json.dumps(meta)), **self.arrays)
+        os.replace(temporary_path, path)
+        return path
+
+    @staticmethod
+    def load(path):
+        with np.load(path, allow_pickle=False) as data:
+            arrays = {name: data[name] for name in data.files if name != "meta"}
+            meta = json.loads(str(data["meta"]))
+        segment_map = {key: segment for key, segment in meta["segment_map"]}
+        return CompiledNetwork(arrays, segment_map, meta["options"], meta["detectors"])
+
+    # config with the options of the yml file, as NetworkYAMLImport.get_config()
+    def get_config(self, config):
+        return config.replace(**self.options)
+
+    def get_adjacent_matrix(self):
+        return sparse.csr_matrix((self.arrays["adjacent_data"], self.arrays["adjacent_indices"],
+                                  self.arrays["adjacent_indptr"]), shape=tuple(self.arrays["adjacent_shape"]))
+
+    def get_topology(self):
+        topology = NetworkTopology.__new__(NetworkTopology)
+        for name, value in self.arrays.items():
+            if name.startswith(TOPOLOGY_PREFIX):
+                setattr(topology, name[len(TOPOLOGY_PREFIX):], value)
+        topology.cell_count = int(topology.cell_count)
+        return topology
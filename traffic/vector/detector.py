@@ -0,0 +1,96 @@
+import logging
+import math
+
+import numpy as np
+
+
+class VirtualDetectors:
+    '''
+    Records occupancy (vehicles / max vehicles) and flow (veh/h) of selected cells at the own interval
+    of each detector, independent of the global LOGGING_INTERVAL.
+    Detectors with the same interval form a group, whose values are gathered with one index array
+    into a preallocated array (rows x detectors of the group).
+    detectors is a list of (name, cell index, interval in seconds).
+    '''
+
+    def __init__(self, detectors, total_seconds, state_shape):
+        self.groups = {}
+        for name, cell, interval in detectors:
+            self.groups.setdefault(interval, []).append((name, cell))
+        for interval, members in self.groups.items():
+            rows = math.ceil(total_seconds / interval)
+            shape = (rows, len(members)) + tuple(state_shape[1:])
+            self.groups[interval] = {"names": [name for name, _ in members],
+                                     "cells": np.array([cell for _, cell in members], dtype=np.int64),
+                                     "occupancy": np.zeros(shape),
+                                     "flow": np.zeros(shape),
+                                     "count": 0}
+
+    def intervals(self):
+        return list(self.groups.keys())
+
+    # called at the boundaries of the simulation, records all groups whose interval starts at second
+    def record(self, second, cells, flow, max_veh):
+        for interval, group in self.groups.items():
+            if second % interval != 0 or group["count"] >= len(group["flow"]):
+                continue
+            index = group["cells"]
+            row = group["count"]
+            group["occupancy"][row] = cells[index] / max_veh[index]
+            group["flow"][row] = flow[index] * 3600  # veh/s -> veh/h
+            group["count"] += 1
+
+    # name -> {cell, interval, occupancy, flow}, the arrays are views of the recorded rows
+    def get_results(self):
+        results = {}
+        for interval, group in self.groups.items():
+            for column, name in enumerate(group["names"]):
+                results[name] = {"cell": int(group["cells"][column]),
+                                 "interval": interval,
+                                 "occupancy": group["occupancy"][:group["count"], column],
+                                 "flow": group["flow"][:group["count"], column]}
+        return results
+
+    # arrays of a checkpoint (VectorCTM.checkpoint): the recorded rows of every group
+    def get_state(self):
+        state = {}
+        for interval, group in self.groups.items():
+            state[f"{interval}_occupancy"] = group["occupancy"][:group["count"]]
+            state[f"{interval}_flow"] = group["flow"][:group["count"]]
+        return state
+
+    def set_state(self, state):
+        for interval, group in self.groups.items():
+            group["count"] = len(state[f"{interval}_flow"])
+            group["occupancy"][:group["count"]] = state[f"{interval}_occupancy"]
+            group["flow"][:group["count"]] = state[f"{interval}_flow"]
+
+    def save(self, path):
+        arrays = {}
+        for name, result in self.get_results().items():
+            arrays[f"{name}_occupancy"] = result["occupancy"]
+            arrays[f"{name}_flow"] = result["flow"]
+        np.savez(path, **arrays)
+        return path
+
+    @staticmethod
+    def map_detectors(detectors_yaml, segment_map, first_key, last_key, cell_length, default_interval):
+        '''
+        Maps the detectors of the yml file ({name: {segment, offset, interval}}, offset in metres from
+        the start of the segment) to (name, cell index, interval).
+        '''
+        detectors = []
+        for name, values in detectors_yaml.items():
+            try:
+                segment = segment_map[values["segment"]]
+            except KeyError:
+                logging.error(f"Detector {name}: segment {values.get('segment')} not found.")
+                continue
+            first = segment[first_key]
+            cell = first + int(values.get("offset", 0) // cell_length[first])
+            if cell > segment[last_key] or cell < first:
+                logging.error(f"Detector {name}: offset {values.get('offset')} is outside of segment "
+                              f"{values['segment']}.")
+                continue
+            detectors.append((name, cell, int(values.get("interval", default_interval))))
+        return detectors
@@ -0,0 +1,91 @@
+import numpy as np
+
+from traffic.vector.cell_sums import CellSums
+
+
+class SegmentKPIs:
+    '''
+    Traffic KPIs per segment and interval, updated incrementally while simulating instead of
+    post-processing the full log.
+    The vehicles and the outflow (flow to the successors + flow out of the network) of each cell are
+    summed up over the interval (CellSums), at the end of an interval the sums are reduced per segment with
+    np.add.reduceat over the FIRST indices of the segment_map and the sums are reset.
+
+    - vkt: vehicle-km travelled, outflow x cell length
+    - vht: vehicle-hours travelled, vehicles x step length
+    - throughput: vehicles leaving the network at the border out cells of the segment
+    - density: mean number of vehicles per km
+    - delay: vehicle-hours in excess of the free flow travel time of the vehicles entering the cells
+    The state can be a vector (n) or a matrix (n x k, ensemble), the KPIs then have one column per scenario.
+    '''
+    KPI_NAMES = ["vkt", "vht", "throughput", "density", "delay"]
+
+    # cells: state at the start of the first interval
+    def __init__(self, segment_map, first_key, cell_length, border_out, time_step, interval_count, cells):
+        state_shape = np.shape(cells)
+        # segments ordered by their first cell, reduceat needs increasing indices
+        segments = sorted(segment_map.items(), key=lambda item: item[1][first_key])
+        self.segment_ids = [key for key, _ in segments]
+        self.starts = np.array([segment[first_key] for _, segment in segments], dtype=np.int64)
+        column_shape = (len(cell_length),) + (1,) * (len(state_shape) - 1)
+        self.cell_length_km = (np.asarray(cell_length, dtype=np.float64) / 1000).reshape(column_shape)
+        self.border_out = np.asarray(border_out, dtype=np.float64).reshape(column_shape)
+        self.segment_length_km = np.add.reduceat(self.cell_length_km, self.starts, axis=0)
+        self.step_hours = time_step / 3600
+
+        self.sums = CellSums(state_shape)
+        # vehicles at the start of the current interval
+        self.start_cells = np.array(cells, dtype=np.float64)
+        self.interval_count = 0
+        self.kpis = {name: np.zeros((interval_count, len(self.starts)) + tuple(state_shape[1:]))
+                     for name in self.KPI_NAMES}
+
+    # adds the sums of the steps since the last boundary
+    def add(self, cell_sums):
+        self.sums.add(cell_sums)
+
+    # reduces the sums of the current interval per segment, does nothing if no step was added.
+    # cells: state at the end of the interval
+    def close_interval(self, cells):
+        sums = self.sums
+        if sums.step_count == 0 or self.interval_count >= len(self.kpis["vht"]):
+            return
+        vht = np.add.reduceat(sums.vehicle_sum, self.starts, axis=0) * self.step_hours
+        # a vehicle entering a cell is counted there at least for the step it arrives (one step in free flow),
+        # so the free flow time is the inflow of the interval. Vehicles arriving at a border out cell leave the
+        # network in the same step and are never counted, the border out cells have no free flow time
+        inflow_sum = sums.outflow_sum + cells - self.start_cells
+        free_flow_hours = np.add.reduceat(inflow_sum * (1 - self.border_out), self.starts, axis=0) * self.step_hours
+        row = self.interval_count
+        self.kpis["vkt"][row] = np.add.reduceat(sums.outflow_sum * self.cell_length_km, self.starts, axis=0)
+        self.kpis["vht"][row] = vht
+        self.kpis["throughput"][row] = np.add.reduceat(sums.outflow_sum * self.border_out, self.starts, axis=0)
+        self.kpis["density"][row] = vht / (sums.step_count * self.step_hours) / self.segment_length_km
+        # not below 0 by rounding
+        self.kpis["delay"][row] = np.maximum(vht - free_flow_hours, 0.0)
+
+        sums.reset()
+        self.start_cells[...] = cells
+        self.interval_count += 1
+
+    # KPIs of the closed intervals, name -> intervals x segments (x scenarios)
+    def get_results(self):
+        return {name: values[:self.interval_count] for name, values in self.kpis.items()}
+
+    def save(self, path):
+        np.savez(path, segment_ids=np.array(self.segment_ids), **self.get_results())
+        return path
+
+    # arrays of a checkpoint (VectorCTM.checkpoint): the closed intervals and the sums of the current one
+    def get_state(self):
+        state = {"sums_" + name: value for name, value in self.sums.get_state().items()}
+        state["start_cells"] = self.start_cells
+        state.update(self.get_results())
+        return state
+
+    def set_state(self, state):
+        self.sums.set_state({name[len("sums_"):]: value for name, value in state.items() if name.startswith("sums_")})
+        self.start_cells[...] = state["start_cells"]
+        self.interval_count = len(state["vht"])
+        for name in self.KPI_NAMES:
+            self.kpis[name][:self.interval_count] = state[name]
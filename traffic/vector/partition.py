@@ -0,0 +1,106 @@
+import numpy as np
+import scipy.sparse as sparse
+from scipy.sparse import csgraph
+
+
+class NetworkPartition:
+    '''
+    Splits the cells of a network into part_count partitions of about the same number of cells with few links
+    between the partitions (cut edges). Segments are never split, so only links between segments can be cut.
+
+    - recursive bisection: the segments are ordered by a breadth first search over the segment graph
+      (predecessors and successors), starting at a pseudo-peripheral segment, the order is cut into two halves
+      with the number of cells of their partitions and each half is bisected again
+    - segments at a partition border are moved to the neighbouring partition with most of their links,
+      as long as the partitions stay within BALANCE_TOLERANCE of the mean size (greedy refinement)
+
+    order lists the cells partition by partition (cells of a partition keep their relative order),
+    position is its inverse, bounds[p]:bounds[p + 1] is the range of partition p in the order.
+    '''
+    BALANCE_TOLERANCE = 0.05
+    REFINEMENT_PASSES = 4
+
+    def __init__(self, adjacent_matrix, segment_map, first_key, last_key, part_count):
+        matrix = sparse.coo_matrix(adjacent_matrix)
+        cell_count = matrix.shape[0]
+        segments = sorted(segment_map.values(), key=lambda segment: segment[first_key])
+        starts = np.array([segment[first_key] for segment in segments], dtype=np.int64)
+        self.segment_weights = np.array([segment[last_key] - segment[first_key] + 1 for segment in segments],
+                                        dtype=np.int64)
+        cell_segment = np.repeat(np.arange(len(segments)), np.diff(np.append(starts, cell_count)))
+
+        # undirected segment graph, one edge per link between two segments
+        row, col = cell_segment[matrix.row], cell_segment[matrix.col]
+        between = row != col
+        graph = sparse.coo_matrix((np.ones(np.count_nonzero(between)), (row[between], col[between])),
+                                  shape=(len(segments), len(segments)))
+        self.segment_graph = (graph + graph.T).tocsr()
+
+        self.part_count = max(1, min(part_count, len(segments)))
+        segment_labels = np.zeros(len(segments), dtype=np.int64)
+        self.bisect(np.arange(len(segments)), 0, self.part_count, segment_labels)
+        self.refine(segment_labels)
+
+        self.labels = segment_labels[cell_segment]
+        self.order = np.argsort(self.labels, kind="stable")
+        self.position = np.empty(cell_count, dtype=np.int64)
+        self.position[self.order] = np.arange(cell_count)
+        self.bounds = np.searchsorted(self.labels[self.order], np.arange(self.part_count + 1))
+        self.cut_edges = int(np.count_nonzero(self.labels[matrix.row] != self.labels[matrix.col]))
+
+    # recursive bisection: the segments are ordered by a breadth first search and cut at the share of cells
+    # of the first half of the partitions, both halves are split again
+    def bisect(self, segments, first_part, part_count, labels):
+        if part_count == 1:
+            labels[segments] = first_part
+            return
+        order = self.bfs_order(segments)
+        first_count = part_count // 2
+        weights = np.cumsum(self.segment_weights[order])
+        split = np.searchsorted(weights, weights[-1] * first_count / part_count)
+        split = min(max(split, first_count), len(order) - (part_count - first_count))
+        self.bisect(order[:split], first_part, first_count, labels)
+        self.bisect(order[split:], first_part + first_count, part_count - first_count, labels)
+
+    # segments in breadth first order over the subgraph of the given segments, component by component
+    def bfs_order(self, segments):
+        subgraph = self.segment_graph[segments][:, segments]
+        component_count, components = csgraph.connected_components(subgraph, directed=False)
+        degree = np.diff(subgraph.indptr)
+        orders = []
+        for component in range(component_count):
+            members = np.flatnonzero(components == component)
+            start = members[np.argmin(degree[members])]
+            # the last segment of a search is far away from its start (pseudo-peripheral)
+            start = csgraph.breadth_first_order(subgraph, start, directed=False, return_predecessors=False)[-1]
+            orders.append(csgraph.breadth_first_order(subgraph, start, directed=False, return_predecessors=False))
+        return segments[np.concatenate(orders)]
+
+    def refine(self, labels):
+        part_weights = np.bincount(labels, weights=self.segment_weights, minlength=self.part_count)
+        mean_weight = self.segment_weights.sum() / self.part_count
+        max_weight = mean_weight * (1 + self.BALANCE_TOLERANCE)
+        min_weight = mean_weight * (1 - self.BALANCE_TOLERANCE)
+        indptr, indices = self.segment_graph.indptr, self.segment_graph.indices
+        for _ in range(self.REFINEMENT_PASSES):
+            moved = 0
+            for segment in range(len(labels)):
+                neighbours = labels[indices[indptr[segment]:indptr[segment + 1]]]
+                part = labels[segment]
+                if len(neighbours) == 0 or np.all(neighbours == part):
+                    continue
+                links = np.bincount(neighbours, minlength=self.part_count)
+                target = np.argmax(links)
+                weight = self.segment_weights[segment]
+                if target != part and links[target] > links[part] \
+                        and part_weights[target] + weight <= max_weight and part_weights[part] - weight >= min_weight:
+                    labels[segment] = target
+                    part_weights[target] += weight
+                    part_weights[part] -= weight
+                    moved += 1
+            if moved == 0:
+                break
+
+    # cell range of partition p in the order
+    def get_range(self, part):
+        return int(self.bounds[part]), int(self.bounds[part + 1])
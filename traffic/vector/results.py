@@ -0,0 +1,64 @@
+import numpy as np
+
+
+class Results:
+    '''
+    Lazy view of the log of a vectorized simulation (timesteps x cells).
+    segment(id) and timestep(t) return NumPy views of the log, nothing is copied.
+    Per segment constants (cell ranges, max vehicles) are computed once,
+    reductions over the whole log (segment_totals, segment_occupancy) are computed on first use and cached.
+    '''
+
+    def __init__(self, log, segment_map, first_key, last_key, predecessors_key, successors_key, max_veh, lanes):
+        self.log = log
+        # segments ordered by their first cell, reduceat needs increasing indices
+        segments = sorted(segment_map.items(), key=lambda item: item[1][first_key])
+        self.segment_ids = [key for key, _ in segments]
+        self.segment_index = {key: index for index, key in enumerate(self.segment_ids)}
+        # the last cell belongs to the segment
+        self.slices = {key: slice(segment[first_key], segment[last_key] + 1) for key, segment in segments}
+        self.predecessors = {key: segment[predecessors_key] for key, segment in segments}
+        self.successors = {key: segment[successors_key] for key, segment in segments}
+        self.starts = np.array([segment[first_key] for _, segment in segments], dtype=np.int64)
+        self.max_veh = np.asarray(max_veh).ravel()
+        self.lanes = np.asarray(lanes).ravel()
+        self.segment_max_vehicles = np.add.reduceat(self.max_veh, self.starts)
+        self.totals = None
+        self.occupancy = None
+
+    def __len__(self):
+        return len(self.log)
+
+    # vehicles of the cells of a segment, timesteps x cells of the segment
+    def segment(self, segment_id):
+        return self.log[:, self.slices[segment_id]]
+
+    # vehicles of all cells at a timestep
+    def timestep(self, time_step):
+        return self.log[time_step]
+
+    def segment_timestep(self, segment_id, time_step):
+        return self.log[time_step, self.slices[segment_id]]
+
+    def max_vehicles(self, segment_id):
+        return self.max_veh[self.slices[segment_id]]
+
+    # max vehicles of the whole segment
+    def max_vehicle(self, segment_id):
+        return self.segment_max_vehicles[self.segment_index[segment_id]]
+
+    def segment_lanes(self, segment_id):
+        return self.lanes[self.slices[segment_id]]
+
+    # vehicles per segment, timesteps x segments (columns in the order of segment_ids)
+    def segment_totals(self):
+        if self.totals is None:
+            self.totals = np.add.reduceat(self.log, self.starts, axis=1) if len(self.log) else \
+                np.zeros((0, len(self.starts)))
+        return self.totals
+
+    # vehicles per segment in percent of its max vehicles, timesteps x segments
+    def segment_occupancy(self):
+        if self.occupancy is None:
+            self.occupancy = self.segment_totals() / self.segment_max_vehicles * 100
+        return self.occupancy
@@ -0,0 +1,72 @@
+import numpy as np
+import scipy.sparse as sparse
+
+
+class NetworkTopology:
+    '''
+    Classifies the links of all cells in one vectorized pass over the CSR arrays (indptr/indices)
+    of the adjacent matrix and its transpose, so the cost is linear in the number of cells.
+    A row of the adjacent matrix holds the predecessors of a cell, a column its successors.
+
+    - merge: both predecessors a and c of a cell b with two predecessors are merge cells,
+      b is their merge target and a and c are each others merge partner.
+    - diverge: a cell with two successors is a diverge cell, its successors are the diverge targets.
+    - ordinary: a cell with exactly one successor, which is no merge cell.
+    - border out: a cell without successors but with predecessors.
+    Index arrays hold -1 for cells without the respective link.
+    '''
+
+    def __init__(self, adjacent_matrix):
+        matrix = sparse.csr_matrix(adjacent_matrix, copy=True)
+        matrix.eliminate_zeros()
+        matrix.sort_indices()
+        transposed = matrix.transpose().tocsr()
+        transposed.sort_indices()
+        self.cell_count = matrix.shape[0]
+        self.indptr = matrix.indptr
+        self.indices = matrix.indices
+        self.indptr_t = transposed.indptr
+        self.indices_t = transposed.indices
+
+        self.in_count = np.diff(matrix.indptr)
+        self.out_count = np.diff(transposed.indptr)
+        no_link = np.full(self.cell_count, -1, dtype=np.int64)
+
+        # merge: first and second predecessor of each cell with more than one predecessor
+        self.merge_cells_b = np.flatnonzero(self.in_count > 1)
+        self.merge_cells_a = matrix.indices[matrix.indptr[self.merge_cells_b]].astype(np.int64)
+        self.merge_cells_c = matrix.indices[matrix.indptr[self.merge_cells_b] + 1].astype(np.int64)
+        self.bool_merge = np.zeros(self.cell_count, dtype=bool)
+        self.bool_merge[self.merge_cells_a] = True
+        self.bool_merge[self.merge_cells_c] = True
+        self.merge_partner = no_link.copy()
+        self.merge_partner[self.merge_cells_a] = self.merge_cells_c
+        self.merge_partner[self.merge_cells_c] = self.merge_cells_a
+        self.merge_target = no_link.copy()
+        self.merge_target[self.merge_cells_a] = self.merge_cells_b
+        self.merge_target[self.merge_cells_c] = self.merge_cells_b
+
+        # diverge: first and second successor of each cell with more than one successor
+        self.diverge_cells = np.flatnonzero(self.out_count > 1)
+        self.bool_diverge = self.out_count > 1
+        self.diverge_first = no_link.copy()
+        self.diverge_second = no_link.copy()
+        self.diverge_first[self.diverge_cells] = transposed.indices[transposed.indptr[self.diverge_cells]]
+        self.diverge_second[self.diverge_cells] = transposed.indices[transposed.indptr[self.diverge_cells] + 1]
+        self.bool_diverge_target = np.zeros(self.cell_count, dtype=bool)
+        self.bool_diverge_target[self.diverge_first[self.diverge_cells]] = True
+        self.bool_diverge_target[self.diverge_second[self.diverge_cells]] = True
+
+        # ordinary: exactly one successor
+        self.bool_ord = (self.out_count == 1) & np.invert(self.bool_merge)
+        self.successor = no_link.copy()
+        has_successor = self.out_count > 0
+        self.successor[has_successor] = transposed.indices[transposed.indptr[:-1][has_successor]]
+
+        self.bool_border_out = (self.out_count == 0) & (self.in_count != 0)
+
+        # every cell must have exactly one link type or be a border out cell
+        link_found = (self.bool_ord ^ (self.bool_merge ^ self.bool_diverge)) | self.bool_border_out
+        self.no_link_cells = np.flatnonzero(np.invert(link_found))
+        # cells without any connection
+        self.isolated_cells = np.flatnonzero((self.in_count == 0) & (self.out_count == 0))
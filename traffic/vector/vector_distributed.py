@@ -0,0 +1,338 @@
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import traceback
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+import scipy.sparse as sparse
+
+from traffic.vector.partition import NetworkPartition
+from traffic.vector.vector_numba import VectorizedFlowNumba, flow_kernel, cell_kernel
+from traffic.vector.vector_parallel import STATE_VECTORS, PARAMETER_VECTORS, INDEX_VECTORS
+
+# cells a step depends on: the new state of a cell depends on the flows of its predecessors, a flow on the
+# send/receive values of the successors and their other predecessors, so information travels 3 links per step
+STEP_RADIUS = 3
+# state of the ghost cells, exchanged between the workers after every batch of steps
+HALO_VECTORS = ["cells", "send", "receive", "current_border_flow"]
+# seconds a worker or the coordinator waits for a connection before giving up
+CONNECT_TIMEOUT = 60
+
+
+# runs a blocking connect/accept in a thread, raises TimeoutError instead of waiting forever
+def call_with_timeout(function, description, timeout=CONNECT_TIMEOUT):
+    result = []
+    errors = []
+
+    def target():
+        try:
+            result.append(function())
+        except Exception as error:
+            errors.append(error)
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if errors:
+        raise errors[0]
+    if not result:
+        raise TimeoutError(f"{description} timed out after {timeout} seconds")
+    return result[0]
+
+
+class PeerConnection:
+    '''
+    TCP connection to a neighbouring worker. Sending is done by a thread, so all workers can send their
+    halo values first and receive afterwards without blocking each other.
+    '''
+
+    def __init__(self, connection, send_indices, receive_indices):
+        self.connection = connection
+        self.send_indices = send_indices  # local indices of the own cells the neighbour needs
+        self.receive_indices = receive_indices  # local indices of the ghost cells owned by the neighbour
+        self.outbox = queue.Queue()
+        self.sender = threading.Thread(target=self.send_loop, daemon=True)
+        self.sender.start()
+
+    def send_loop(self):
+        while (payload := self.outbox.get()) is not None:
+            try:
+                self.connection.send_bytes(payload)
+            except OSError:
+                return
+
+    def send(self, arrays):
+        self.outbox.put(np.stack([array[self.send_indices] for array in arrays]).tobytes())
+
+    def receive(self, arrays):
+        values = np.frombuffer(self.connection.recv_bytes(), dtype=np.float64).reshape(len(arrays), -1)
+        for array, array_values in zip(arrays, values):
+            array[self.receive_indices] = array_values
+
+    def close(self):
+        self.outbox.put(None)
+        self.sender.join(timeout=5)
+        self.connection.close()
+
+
+def halo_worker(coordinator_address, authkey, part_count):
+    '''
+    Worker of VectorizedFlowDistributed. It connects to the coordinator, reports the address of its own listener,
+    receives its partition (own cells and ghost cells) and the addresses of its neighbours and connects to them.
+    A run command simulates step_count seconds in batches of halo_steps seconds: the own and ghost cells are
+    simulated without communication, between two batches the ghost cells are updated by the neighbours.
+    It can run on any host, which reaches the coordinator and the other workers.
+    '''
+    coordinator = call_with_timeout(lambda: Client(coordinator_address, authkey=authkey),
+                                    "Connecting to the coordinator")
+    # all lower ranks may connect at once
+    listener = Listener((coordinator_address[0], 0), backlog=part_count, authkey=authkey)
+    coordinator.send(listener.address)
+    setup = coordinator.recv()
+    rank = setup["rank"]
+    a = setup["arrays"]
+
+    # connections to the neighbours: to the higher ranks, from the lower ranks
+    connections = {}
+    for peer, address in setup["peer_addresses"].items():
+        if peer > rank:
+            connections[peer] = call_with_timeout(lambda: Client(address, authkey=authkey),
+                                                  f"Connecting to worker {peer}")
+            connections[peer].send(rank)
+    try:
+        for _ in range(sum(1 for peer in setup["peer_addresses"] if peer < rank)):
+            connection = call_with_timeout(listener.accept, f"Worker {rank} waiting for its neighbours")
+            connections[connection.recv()] = connection
+    finally:
+        listener.close()
+    peers = [PeerConnection(connections[peer], *setup["halo_indices"][peer]) for peer in sorted(connections)]
+    halo = [a[name] for name in HALO_VECTORS]
+    flow_count, cell_count, own_count, halo_steps = (setup["flow_count"], setup["cell_count"], setup["own_count"],
+                                                     setup["halo_steps"])
+    try:
+        while (command := coordinator.recv()) is not None:
+            step_count, accumulate, state, sums = command
+            for name, values in state.items():
+                a[name][:len(values)] = values
+            if accumulate:
+                a["vehicle_sum"][:own_count], a["outflow_sum"][:own_count] = sums
+            done = 0
+            while done < step_count:
+                if done > 0:
+                    for peer in peers:
+                        peer.send(halo)
+                    for peer in peers:
+                        peer.receive(halo)
+                for _ in range(min(halo_steps, step_count - done)):
+                    flow_kernel(0, flow_count, a["send"], a["receive"], a["flow"],
+                                a["src_ptr"], a["src_idx"], a["src_val"], a["dst_ptr"], a["dst_idx"], a["dst_val"],
+                                a["bool_ord"], a["bool_merge"], a["bool_diverge"], a["merge_partner"],
+                                a["merge_percentage"], a["diverge_first"], a["diverge_second"], a["diverge_percentage"])
+                    cell_kernel(0, cell_count, a["cells"], a["send"], a["receive"], a["flow"],
+                                a["current_border_flow"], a["border_inflow"], a["src_ptr"], a["src_idx"], a["src_val"],
+                                a["diverge_percentage"], a["border_out_flow"], a["max_flow"], a["delta"], a["max_veh"],
+                                accumulate, a["vehicle_sum"], a["outflow_sum"])
+                done += min(halo_steps, step_count - done)
+            coordinator.send({name: a[name][:own_count] for name in STATE_VECTORS + ["vehicle_sum", "outflow_sum"]})
+    except Exception:
+        # closing the connections stops the neighbours waiting for the halo values of this worker
+        coordinator.send(traceback.format_exc())
+    finally:
+        for peer in peers:
+            peer.close()
+        coordinator.close()
+
+
+class VectorizedFlowDistributed(VectorizedFlowNumba):
+    '''
+    VectorizedFlowNumba distributed over PARALLEL_WORKERS worker processes (halo_worker), which communicate over TCP.
+    The object itself is the coordinator: it runs the boundaries (border inflow, log, KPIs, detectors),
+    sends the state to the workers at the start of every run_steps() call and gathers the state and the cell
+    sums of the KPIs from them at the end.
+
+    Every worker simulates the cells of one partition (NetworkPartition) and a halo of ghost cells around it,
+    which are simulated redundantly. With a halo of STEP_RADIUS * HALO_STEPS cells the own cells stay exact
+    for HALO_STEPS steps, so the workers exchange the halo values with their neighbours only once per
+    HALO_STEPS steps. The results are the same as the ones of VectorizedFlow.
+    The workers are started locally on DISTRIBUTED_HOST, halo_worker() can be started on other hosts as well.
+    '''
+
+    def __init__(self, yaml_input, config=None):
+        self.partition = None
+        self.worker_cells = []
+        self.own_cells = []
+        self.coordinator_connections = []
+        self.workers = []
+        super().__init__(yaml_input, config)
+
+    def get_worker_count(self):
+        return self.settings.PARALLEL_WORKERS or os.cpu_count() or 1
+
+    # cells of the halo around the given cells, ordered by their distance
+    @staticmethod
+    def halo_levels(graph, cells, depth):
+        levels = [cells]
+        reached = np.zeros(graph.shape[0], dtype=bool)
+        reached[cells] = True
+        for _ in range(depth):
+            neighbours = np.unique(graph[levels[-1]].indices)
+            neighbours = neighbours[np.invert(reached[neighbours])]
+            reached[neighbours] = True
+            levels.append(neighbours)
+        return levels
+
+    # arrays of the kernels for the own cells and the ghost cells of a partition,
+    # numbered by the distance to the partition (own cells first)
+    def init_worker(self, part, graph, halo_steps):
+        own = np.flatnonzero(self.partition.labels == part)
+        levels = self.halo_levels(graph, own, STEP_RADIUS * halo_steps)
+        cells = np.concatenate(levels)
+        local = np.full(len(self.cells), -1, dtype=np.int64)
+        local[cells] = np.arange(len(cells))
+        adjacent_matrix = sparse.csr_matrix(self.adjacent_matrix)[cells][:, cells].tocsr()
+        adjacent_matrix.sort_indices()
+        transposed_matrix = adjacent_matrix.transpose().tocsr()
+        transposed_matrix.sort_indices()
+        arrays = {"src_ptr": adjacent_matrix.indptr.astype(np.int64),
+                  "src_idx": adjacent_matrix.indices.astype(np.int64),
+                  "src_val": adjacent_matrix.data.astype(np.float64),
+                  "dst_ptr": transposed_matrix.indptr.astype(np.int64),
+                  "dst_idx": transposed_matrix.indices.astype(np.int64),
+                  "dst_val": transposed_matrix.data.astype(np.float64)}
+        for name in PARAMETER_VECTORS:
+            arrays[name] = np.asarray(getattr(self, name))[cells]
+        for name in INDEX_VECTORS:
+            index = np.asarray(getattr(self, name))[cells]
+            # links out of the halo are only used by cells, which are not simulated
+            arrays[name] = np.where(index >= 0, local[np.maximum(index, 0)], -1)
+        for name in STATE_VECTORS + ["border_inflow", "vehicle_sum", "outflow_sum"]:
+            arrays[name] = np.zeros(len(cells))
+        level_counts = np.cumsum([len(level) for level in levels])
+        # the flows are needed one link further than the cells
+        return {"arrays": arrays, "own_count": len(own), "halo_steps": halo_steps,
+                "cell_count": int(level_counts[-1 - STEP_RADIUS]), "flow_count": int(level_counts[-STEP_RADIUS])}, cells
+
+    # indices of the given cells in the arrays of a worker
+    def get_local_indices(self, part, cells):
+        sorter = np.argsort(self.worker_cells[part])
+        return sorter[np.searchsorted(self.worker_cells[part], cells, sorter=sorter)]
+
+    def start_workers(self):
+        part_count = self.get_worker_count()
+        halo_steps = max(1, self.settings.HALO_STEPS)
+        # the partition is kept for the next run after reset()
+        if self.partition is None:
+            self.partition = NetworkPartition(self.adjacent_matrix, self.segment_map, self.FIRST, self.LAST, part_count)
+        part_count = self.partition.part_count
+        adjacent_matrix = sparse.csr_matrix(self.adjacent_matrix)
+        graph = (adjacent_matrix + adjacent_matrix.T).tocsr()
+
+        authkey = os.urandom(32)
+        # all workers connect at once, the backlog must hold all of them
+        listener = Listener((self.settings.DISTRIBUTED_HOST, 0), backlog=part_count, authkey=authkey)
+        try:
+            for _ in range(part_count):
+                worker = multiprocessing.Process(target=halo_worker, args=(listener.address, authkey, part_count),
+                                                 daemon=True)
+                worker.start()
+                self.workers.append(worker)
+            peer_addresses = []
+            for _ in range(part_count):
+                connection = call_with_timeout(listener.accept, "Waiting for the workers")
+                peer_addresses.append(connection.recv())
+                self.coordinator_connections.append(connection)
+        except Exception:
+            self.stop_workers()
+            raise
+        finally:
+            listener.close()
+
+        setups = []
+        for part in range(part_count):
+            setup, cells = self.init_worker(part, graph, halo_steps)
+            setups.append(setup)
+            self.worker_cells.append(cells)
+            self.own_cells.append(cells[:setup["own_count"]])
+        # halo indices: the ghost cells of a worker, grouped by the worker owning them
+        for part in range(part_count):
+            setups[part]["rank"] = part
+            setups[part]["peer_addresses"] = {}
+            setups[part]["halo_indices"] = {}
+        for part in range(part_count):
+            ghosts = self.worker_cells[part][setups[part]["own_count"]:]
+            owners = self.partition.labels[ghosts]
+            for owner in np.unique(owners).tolist():
+                owner_ghosts = np.sort(ghosts[owners == owner])
+                setups[part]["peer_addresses"][owner] = peer_addresses[owner]
+                setups[owner]["peer_addresses"][part] = peer_addresses[part]
+                # the owner sends, the partition receives
+                setups[owner]["halo_indices"].setdefault(part, [None, None])[0] = \
+                    self.get_local_indices(owner, owner_ghosts)
+                setups[part]["halo_indices"].setdefault(owner, [None, None])[1] = \
+                    self.get_local_indices(part, owner_ghosts)
+        for part in range(part_count):
+            for peer, indices in setups[part]["halo_indices"].items():
+                # neighbour in one direction only: nothing to send or nothing to receive
+                setups[part]["halo_indices"][peer] = [np.zeros(0, dtype=np.int64) if index is None else index
+                                                      for index in indices]
+            self.coordinator_connections[part].send(setups[part])
+        self.run_statistics["distributed_workers"] = part_count
+        self.run_statistics["distributed_cut_links"] = self.partition.cut_edges
+        self.run_statistics["distributed_halo_cells"] = int(sum(len(cells) for cells in self.worker_cells)
+                                                           - len(self.cells))
+        logging.info(f"{part_count} partitions, {self.partition.cut_edges} cut links, halo of {halo_steps} steps")
+
+    def stop_workers(self):
+        for connection in self.coordinator_connections:
+            try:
+                connection.send(None)
+                connection.close()
+            except OSError:
+                pass
+        for worker in self.workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+        self.coordinator_connections = []
+        self.workers = []
+        self.worker_cells = []
+        self.own_cells = []
+
+    def close(self):
+        self.stop_workers()
+
+    def run_steps(self, step_count):
+        if not self.workers:
+            self.start_workers()
+        accumulate = self.cell_sums is not None
+        for connection, cells, own in zip(self.coordinator_connections, self.worker_cells, self.own_cells):
+            state = {name: getattr(self, name)[cells] for name in STATE_VECTORS + ["border_inflow"]}
+            sums = (self.cell_sums.vehicle_sum[own], self.cell_sums.outflow_sum[own]) if accumulate else None
+            connection.send((step_count, accumulate, state, sums))
+        # KPIs: the cell sums of the own cells are gathered with the state
+        results = [connection.recv() for connection in self.coordinator_connections]
+        errors = [result for result in results if isinstance(result, str)]
+        if errors:
+            self.stop_workers()
+            raise RuntimeError("Distributed worker failed:\n" + errors[0])
+        for result, own in zip(results, self.own_cells):
+            for name in STATE_VECTORS:
+                getattr(self, name)[own] = result[name]
+            if accumulate:
+                self.cell_sums.vehicle_sum[own] = result["vehicle_sum"]
+                self.cell_sums.outflow_sum[own] = result["outflow_sum"]
+        if accumulate:
+            self.cell_sums.add_steps(step_count)
+
+    def simulate(self, checkpoint_intervals=None, checkpoint_path=None):
+        try:
+            super().simulate(checkpoint_intervals, checkpoint_path)
+        finally:
+            self.close()
+
+    @staticmethod
+    def get_name():
+        return "Vectorized Calculation distributed over TCP"
@@ -0,0 +1,104 @@
+import os
+
+import numpy as np
+
+from resources import ListMethods
+from traffic.vector.results import Results
+from traffic.vector.vector_flow import VectorizedFlow
+
+
+class VectorizedFlowEnsemble(VectorizedFlow):
+    '''
+    Simulates several demand scenarios on the same network in one pass.
+    The state vectors (cells, send, receive, flow, current_border_flow) become n x k matrices,
+    with one column per scenario, so every step needs only one sparse matrix x dense matrix product.
+    The constant vectors (max_flow, delta, max_veh, link masks, ...) are stored as n x 1 columns
+    and are broadcast over the scenario axis.
+
+    scenarios is a list of dicts {segment_id: border_flow}, border_flow given in the same form as in the yml file.
+    Border flows of segments missing in a scenario are taken from the yml file.
+    '''
+    SCENARIO_AXIS = 1
+
+    def __init__(self, segments, scenarios, config=None):
+        self.scenarios = scenarios
+        self.scenario_count = len(scenarios)
+        super().__init__(segments, config)
+        self.init_ensemble()
+        # the state matrices and border flow table of the scenarios
+        self.store_initial_state()
+
+    def init_ensemble(self):
+        cell_count = len(self.cells)
+
+        # border flow table: n_border x STEPS x k, column j of scenario s is border_flow[:, j, s].
+        # Segments without border flow in the yml file can get one in a scenario
+        border_cells = list(self.border_cells)
+        for scenario_flows in self.scenarios:
+            for segment_id in scenario_flows.keys():
+                first = self.segment_map[segment_id][self.FIRST]
+                if first not in border_cells:
+                    border_cells.append(first)
+        border_flow = np.zeros((len(border_cells), self.settings.STEPS, self.scenario_count))
+        border_flow[:len(self.border_cells)] = self.border_flow[:, :, np.newaxis]
+        for scenario, scenario_flows in enumerate(self.scenarios):
+            for segment_id, segment_flow in scenario_flows.items():
+                row = border_cells.index(self.segment_map[segment_id][self.FIRST])
+                segment_flow = ListMethods.__fill_slots__(segment_flow, self.settings.STEPS)
+                border_flow[row, :, scenario] = np.array(segment_flow) / 3600
+        self.border_cells = np.array(border_cells, dtype=np.int64)
+        self.border_flow = border_flow
+
+        # constant vectors as columns, so they broadcast over the scenarios
+        self.max_flow = self.max_flow.reshape(cell_count, 1)
+        self.delta = self.delta.reshape(cell_count, 1)
+        self.max_veh = self.max_veh.reshape(cell_count, 1)
+        self.merge_percentage = self.merge_percentage.reshape(cell_count, 1)
+        self.diverge_percentage = self.diverge_percentage.reshape(cell_count, 1)
+        self.border_out_flow = self.border_out_flow.reshape(cell_count, 1)
+        self.bool_ord = self.bool_ord.reshape(cell_count, 1)
+        self.bool_merge = self.bool_merge.reshape(cell_count, 1)
+        self.bool_diverge = self.bool_diverge.reshape(cell_count, 1)
+
+        # state matrices: n x k
+        self.cells = np.repeat(self.cells.reshape(cell_count, 1), self.scenario_count, axis=self.SCENARIO_AXIS)
+        self.flow = np.zeros((cell_count, self.scenario_count))
+        self.calc_send()
+        self.calc_receive()
+        self.set_border_inflow(0)
+        self.current_border_flow = np.minimum(self.border_inflow, self.receive)
+        # log and KPIs with one n x k matrix per logged second
+        self.init_recording()
+
+    def get_results_np(self, scenario=None):
+        # results = [timestep][cell][scenario], or [timestep][cell] if a scenario is given
+        np_log = self.get_log()
+        if scenario is None:
+            return np_log
+        return np_log[:, :, scenario]
+
+    def get_results(self, scenario=0):
+        return Results(self.get_results_np(scenario), self.segment_map, self.FIRST, self.LAST, self.PREDECESSORS,
+                       self.SUCCESSORS, self.max_veh, self.lanes)
+
+    def get_results_dict(self, scenario=0):
+        return self.build_results_dict(self.get_results(scenario))
+
+    def get_segments(self, scenario=0):
+        return self.build_segments(self.get_results(scenario))
+
+    def get_scenario_csv_path(self, scenario):
+        root, extension = os.path.splitext(self.csv_path)
+        return f"{root}_scenario_{scenario}{extension}"
+
+    def export_csv(self):
+        # one csv file per scenario
+        for scenario in range(0, self.scenario_count):
+            csv_path = self.get_scenario_csv_path(scenario)
+            print("Saving results to: ", csv_path)
+            np.savetxt(csv_path, self.get_results_np(scenario), delimiter=';')
+            print("Log saved to: ", csv_path)
+
+    @staticmethod
+    def get_name():
+        return "Vectorized Calculation with Vectorized Flow (Ensemble)"
@@ -10,13 +10,10 @@ from traffic.vector.vector_sparse import VectorSparse
 from visualize import Visualization
 
 
-def xor(a, b):
-    return (a and not b) or (not a and b)
-
-
 class VectorizedFlow(VectorSparse):
-    def __init__(self, yaml_input):
+    def __init__(self, yaml_input, config=None):
 
+        self.topology = None
         self.bool_merge_capacity = None
         self.bool_merge = None
         self.bool_ord = None
@@ -27,7 +24,7 @@ class VectorizedFlow(VectorSparse):
         self.first_diverge_matrix = None
         self.second_diverge_matrix = None
         self.diverge_percentage = None
-        super().__init__(yaml_input)
+        super().__init__(yaml_input, config)
 
     def init_vectors(self):
         # cells is now filled
@@ -38,11 +35,24 @@ class VectorizedFlow(VectorSparse):
 
         self.border_out_flow = np.zeros(len(self.cells))
 
-        self.merge_matrix = sparse.csr_matrix(np.diag(np.ones(len(self.cells), dtype=bool)))
-        self.first_diverge_matrix = sparse.csr_matrix(np.zeros((len(self.cells), len(self.cells)), dtype=bool))
-        self.second_diverge_matrix = sparse.csr_matrix(np.zeros((len(self.cells), len(self.cells)), dtype=bool))
-
         self.diverge_percentage = np.ones(len(self.cells))
+
+    # builds the merge and diverge matrices directly in CSR from the index arrays of the topology,
+    # so they need O(n) memory. Every row holds at most one entry.
+    def init_link_matrices(self):
+        cell_count = len(self.cells)
+        cell_index = np.arange(cell_count)
+        # merge matrix: identity with the rows of the merge partners swapped
+        merge_columns = np.where(self.topology.bool_merge, self.topology.merge_partner, cell_index)
+        self.merge_matrix = self.index_matrix(cell_index, merge_columns, cell_count)
+
+        diverge_b = self.topology.diverge_cells
+        self.first_diverge_matrix = self.index_matrix(diverge_b, self.topology.diverge_first[diverge_b], cell_count)
+        self.second_diverge_matrix = self.index_matrix(diverge_b, self.topology.diverge_second[diverge_b], cell_count)
+
+    @staticmethod
+    def index_matrix(rows, columns, cell_count):
+        return sparse.csr_matrix((np.ones(len(rows), dtype=bool), (rows, columns)), shape=(cell_count, cell_count))
     def calc_div_coefficient(self, a):
         return 1  # now is every entry in the adjacent matrix 1
 
@@ -87,81 +97,63 @@ class VectorizedFlow(VectorSparse):
 
     def init_flows(self):
         self.init_vectors()
-        for i in range(0, len(self.flow)):
-            link_found = False
-            cell_b = i
-            if self.adjacent_matrix.getrow(i).count_nonzero() > 1:  # Merge
-                nonzero = self.adjacent_matrix.getrow(i).nonzero()
-                cell_a = nonzero[1][0]  # get first y coordinate
-                cell_c = nonzero[1][1]  # get second y coordinate
-                self.bool_merge[cell_a] = True
-                self.bool_ord[cell_a] = False
-                self.merge_percentage[cell_a] = 0.5
-
-                self.bool_merge[cell_c] = True
-                self.bool_ord[cell_c] = False
-                self.merge_percentage[cell_c] = 0.5
-
-                '''
-                betrachtet wird nur der ausgehende Fluss,
-                daher werden nur die Werte von a und c gesetzt
-                a 
-                 \
-                  b 
-                 / 
-                c
-                Aus Sicht von a und c ist deren Verbindung ordinary, erst durch b 
-                wird sichtbar, dass es sich um einen Merge handelt.
-                '''
-
-                # swap rows in merge matrix
-                self.merge_matrix[[cell_a, cell_c]] = self.merge_matrix[[cell_c, cell_a]]
-
-            if self.adjacent_matrix.getcol(i).count_nonzero() > 1:  # Diverge
-                nonzero = self.adjacent_matrix.getcol(i).nonzero()
-                cell_a = nonzero[0][0]  # get first x coordinate
-                cell_c = nonzero[0][1]  # get second x coordinate
-
-                self.bool_diverge[cell_b] = True
-                '''
-                Anders als beim Merge wird beim diverge der ausgehende Gesamtfluss von b berechnet
-                und anschließend mithilfe der Verteilungen in der Adjazenzmatrix auf a und c verteilt.
-                  a
-                 /
-                b
-                 \
-                  c 
-                '''
-                self.first_diverge_matrix[cell_b, cell_a] = True
-                self.second_diverge_matrix[cell_b, cell_c] = True
-                self.diverge_percentage[cell_a] = 0.5
-                self.diverge_percentage[cell_c] = 0.5
-
-            if self.adjacent_matrix.getcol(i).count_nonzero() == 1:  # ordinary
-                if not self.bool_merge[cell_b]:
-                    self.bool_ord[cell_b] = True
-
-            if xor(self.bool_ord[cell_b], xor(self.bool_merge[cell_b], self.bool_diverge[cell_b])):
-                '''
-                Es darf ausschließlich ein bool-Wert true sein, da eine Zelle ausschließlich
-                einem Typ zugeordnet werden darf.
-                '''
-                link_found = True
-            if self.adjacent_matrix.getcol(i).count_nonzero() == 0 \
-                    and not self.adjacent_matrix.getrow(i).count_nonzero() == 0:  # Border Out Cell
-                self.border_out_flow[cell_b] = self.max_flow[cell_b]
-                link_found = True
-
-            if not link_found:
-                print("No link found for cell " + str(cell_b))
+        self.topology = self.get_topology()
+        self.bool_ord = self.topology.bool_ord.copy()
+        self.bool_diverge = self.topology.bool_diverge.copy()
+        self.bool_merge = self.topology.bool_merge.copy()
+        self.merge_percentage[self.bool_merge] = 0.5
+
+        '''
+        betrachtet wird nur der ausgehende Fluss,
+        daher werden nur die Werte von a und c gesetzt
+        a 
+         \
+          b 
+         / 
+        c
+        Aus Sicht von a und c ist deren Verbindung ordinary, erst durch b 
+        wird sichtbar, dass es sich um einen Merge handelt.
+        '''
+        '''
+        Anders als beim Merge wird beim diverge der ausgehende Gesamtfluss von b berechnet
+        und anschließend mithilfe der Verteilungen in der Adjazenzmatrix auf a und c verteilt.
+          a
+         /
+        b
+         \
+          c 
+        '''
+        self.init_link_matrices()
+        self.diverge_percentage[self.topology.bool_diverge_target] = 0.5
+
+        # Border Out Cell
+        border_out = self.topology.bool_border_out
+        self.border_out_flow[border_out] = self.max_flow[border_out]
+
+        '''
+        Es darf ausschließlich ein bool-Wert true sein, da eine Zelle ausschließlich
+        einem Typ zugeordnet werden darf.
+        '''
+        for cell_b in self.topology.no_link_cells:
+            print("No link found for cell " + str(cell_b))
 
     def calc_cells(self):
         self.cells = self.cells + self.diverge_percentage * self.adjacent_matrix.dot(
             self.flow) - self.flow + self.current_border_flow
         cbof = np.minimum(self.border_out_flow, self.cells)
         self.cells = self.cells - cbof
+        self.border_exit = cbof
         return
 
+    def get_topology(self):
+        # the topology is computed once by init_flows
+        if self.topology is not None:
+            return self.topology
+        return super().get_topology()
+
+    def get_border_out_cells(self):
+        return self.topology.bool_border_out
+
 
     @staticmethod
     def get_name():
@@ -182,11 +174,11 @@ def main():
             simulation.simulate()
             end = time.time()
             print(f"Running time: {end - start:.2f} seconds")
-            if Settings.SAVE_RESULTS:
+            if simulation.settings.SAVE_RESULTS:
                 simulation.save_results()
-            if Settings.SHOW_PLOTS:
+            if simulation.settings.SHOW_PLOTS:
                 simulation.show_results()
-            if Settings.SAVE_PLOTS:
+            if simulation.settings.SAVE_PLOTS:
                 simulation.save_result_plots()
         except yaml.YAMLError as exc:
             print(exc)
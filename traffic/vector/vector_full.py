@@ -7,10 +7,10 @@ import numpy as np
 
 
 class VectorFullMatrix(vg.VectorCTM):
-    flow_dict = {}
     ADJACENT_FACTOR = 1
-    def __init__(self, yaml_input):
-        super().__init__(yaml_input)
+    def __init__(self, yaml_input, config=None):
+        self.flow_dict = {}
+        super().__init__(yaml_input, config)
 
     def create_adjacent_matrix(self):
         temp_adjacent_matrix = np.zeros((len(self.cells), len(self.cells)), np.double)
@@ -118,8 +118,8 @@ class VectorFullMatrix(vg.VectorCTM):
                 error = 'No allowed link found for cell ' + str(i)
                 raise Exception(error)
 
-    def simulate(self):
-        super().simulate()
+    def simulate(self, checkpoint_intervals=None, checkpoint_path=None):
+        super().simulate(checkpoint_intervals, checkpoint_path)
 
 
 def main():
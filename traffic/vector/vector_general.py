@@ -1,3 +1,4 @@
+import json
 import logging
 import math
 import os
@@ -8,84 +9,356 @@ from statistics import median
 import pandas as pd
 from matplotlib import pyplot as plt
 import numpy as np
+import scipy.sparse as sparse
+from scipy.sparse.linalg import splu
 
 import visualize.IVisualize
 from resources import Settings, ListMethods
+from resources.ResultStore import ResultStore, ResultStoreWriter, StreamingResultWriter
 from traffic.SimulationInterface import SimulationInterface
+from traffic.vector.cell_sums import CellSums
+from traffic.vector.compiled_network import CompiledNetwork, NETWORK_VECTORS
+from traffic.vector.detector import VirtualDetectors
+from traffic.vector.kpi import SegmentKPIs
+from traffic.vector.results import Results
+from traffic.vector.topology import NetworkTopology
+
+
+# result paths (without extension) given to the simulations of this process, see init_csv_path()
+result_paths = set()
 
 
 class VectorCTM(SimulationInterface, visualize.IVisualize.IVisualizeGraph, visualize.IVisualize.IVisualizeHeatmap):
     FIRST = "first"
     LAST = "last"
-    border_flow = []
-    current_border_flow = []
-    cells = []
-    adjacent_matrix = []
-    segment_map = {}
-    lanes = []
-    velo = []
-    flow = []
-    max_flow = []
-    delta = []
-    max_veh = []
-    receive = []
-    send = []
-    merge_percentage = []
-    log = []
-    sim_step = 0
-    csv_path = ""
-
-
-
-    def __init__(self, segments):
-        super().__init__(segments)
-        self.create_adjacent_matrix()
+    # vectors with one entry per cell, created by import_yaml_network
+    CELL_VECTORS = ["cells", "lanes", "velo", "max_flow", "max_veh", "delta", "send", "receive", "flow"]
+    # state of the simulation before the first step, restored by reset()
+    STATE_VECTORS = ["cells", "send", "receive", "flow"]
+    # vectors of a checkpoint, see checkpoint()
+    CHECKPOINT_VECTORS = ["cells", "send", "receive", "flow", "current_border_flow", "border_cells", "border_flow"]
+    # settings a checkpoint can only be restored with
+    CHECKPOINT_SETTINGS = ["STEPS", "INTERVAL", "TIME_STEP", "LOGGING_INTERVAL", "LOG_MODE", "KPI_MODE"]
+    CHECKPOINT_VERSION = 2
+    # warm_start() source of the steady state of the first interval, steps between two convergence checks
+    STEADY_STATE = "steady"
+    STEADY_STATE_CHECK_STEPS = 10
+
+    def __init__(self, segments, config=None):
+        # all state belongs to the instance, several simulations can exist in the same process
+        self.border_cells = []
+        self.border_flow = []
+        self.border_inflow = []
+        self.current_border_flow = []
+        self.cells = []
+        self.adjacent_matrix = []
+        self.segment_map = {}
+        self.lanes = []
+        self.velo = []
+        self.flow = []
+        self.max_flow = []
+        self.delta = []
+        self.max_veh = []
+        self.receive = []
+        self.send = []
+        self.merge_percentage = []
+        self.log = []
+        self.log_count = 0
+        # while streaming (stream_results()) the log is a ring of STREAM_QUEUE_DEPTH rows, the rows are in the store
+        self.log_ring = False
+        self.result_sink = None
+        # streamed flow log of the averaged mode
+        self.flow_sink = None
+        self.kpis = None
+        self.detectors = None
+        self.detectors_yaml = None
+        self.results_view = None
+        # set if the network was loaded from a compiled network instead of the yml segments
+        self.compiled_network = None
+        # sums of the steps since the last boundary, only if KPIs or the averaged log are used
+        self.cell_sums = None
+        # averaged log: sums of the current logging window and the mean outflow of every window
+        self.log_sums = None
+        self.flow_log = None
+        # vehicles leaving the network in the last step, set by implementations with border out cells
+        self.border_exit = 0.0
+        self.sim_step = 0
+        self.second = 0
+        self.csv_path = ""
+        # state before the first step and border flows of the network, see reset()
+        self.initial_state = None
+        self.network_border_cells = None
+        self.network_border_flow = None
+        # automatic checkpoints of simulate(): every checkpoint_seconds to checkpoint_path
+        self.checkpoint_seconds = 0
+        self.checkpoint_path = None
+        self.checkpoint_second = None
+        super().__init__(segments, config)
+        if self.compiled_network is None:
+            self.create_adjacent_matrix()
+            self.border_flow = self.border_flow / 3600
+            self.max_flow = self.max_flow / 3600  # veh/h -> veh/s
         self.results = {}
 
-        self.border_flow = np.array(self.border_flow) / 3600
-        self.cells = np.array(self.cells)
-        self.lanes = np.array(self.lanes)
-        self.velo = np.array(self.velo)
-        self.flow = np.array(self.flow)
-        self.max_flow = np.array(self.max_flow) / 3600
-        self.delta = np.array(self.delta)  # veh/h -> veh/s
-        self.max_veh = np.array(self.max_veh)
         self.merge_percentage = np.zeros(len(self.cells))
-        self.receive = np.array(self.receive)
-        self.send = np.array(self.send)
-        self.current_border_flow = np.minimum(self.border_flow[:, self.sim_step], self.receive)
+        self.set_border_inflow(0)
+        self.current_border_flow = np.minimum(self.border_inflow, self.receive)
         self.init_flows()
+        self.init_csv_path()
+        self.init_recording()
+        self.store_initial_state()
+        # updated_data = np.vstack((np.transpose(self.cells), np.transpose(self.cells)))
+        # np.savetxt(self.csv_path, self.cells, delimiter=';')
+
+    def init_csv_path(self):
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         # get current working directory
         subdirectory = 'vector/'  # specify the subdirectory
         directory = os.path.join(os.getcwd(), self.settings.RESULT_PATH + subdirectory)
         os.makedirs(directory, exist_ok=True)
-        self.csv_path = os.path.join(directory, f'{timestamp}.csv')
-        # updated_data = np.vstack((np.transpose(self.cells), np.transpose(self.cells)))
-        # np.savetxt(self.csv_path, self.cells, delimiter=';')
+        # simulations started in the same second get their own result files: the process id separates concurrent
+        # processes (sweep workers), result_paths and the index the simulations of this process
+        prefix = f"{timestamp}_{os.getpid()}"
+        name, index = prefix, 0
+        while os.path.join(directory, name) in result_paths or \
+                any(os.path.exists(os.path.join(directory, name + suffix)) for suffix in ["", ".csv", "_log.npy"]):
+            index += 1
+            name = f"{prefix}_{index}"
+        result_paths.add(os.path.join(directory, name))
+        self.csv_path = os.path.join(directory, f'{name}.csv')
+
+    # copies of the state before the first step and of the border flows of the network, used by reset()
+    def store_initial_state(self):
+        self.initial_state = {name: np.array(getattr(self, name)) for name in self.STATE_VECTORS}
+        self.network_border_cells = np.array(self.border_cells)
+        self.network_border_flow = np.array(self.border_flow)
+
+    # prepares a new run on the same network without rebuilding it: the topology, parameter vectors and compiled
+    # kernels are kept, the state, log, KPIs and detectors start again.
+    # initial_state: vehicles per cell at the start (default: the state of the network, empty cells)
+    # border_flow: {segment_id: border_flow} in the form of the yml file, replaces the border flows of these segments
+    def reset(self, initial_state=None, border_flow=None):
+        self.close_result_sink()
+        self.set_state(initial_state)
+        self.set_border_flow(border_flow or {})
+        self.sim_step = 0
+        self.second = 0
+        self.results = {}
+        self.results_view = None
+        self.run_statistics = {}
+        self.set_border_inflow(0)
+        self.current_border_flow = np.minimum(self.border_inflow, self.receive)
+        # a run that logged nothing (e.g. reset() before the first run) leaves no log file behind
+        self.discard_empty_log()
+        self.init_csv_path()
+        self.init_recording()
+        self.set_detectors(self.detectors_yaml)
+
+    # state vectors of the network before the first step, with the given vehicles per cell if not None.
+    # Only the state, the log, KPIs and result path stay as they are
+    def set_state(self, initial_state=None):
+        for name, value in self.initial_state.items():
+            setattr(self, name, np.array(value))
+        if initial_state is not None:
+            cells = np.broadcast_to(np.asarray(initial_state, dtype=np.float64).reshape(
+                np.shape(initial_state) + (1,) * (np.ndim(self.cells) - np.ndim(initial_state))), np.shape(self.cells))
+            self.cells = np.array(cells)
+            self.calc_send()
+            self.calc_receive()
+
+    # border flow table of the network with the border flows of the given segments replaced (veh/h -> veh/s),
+    # the flows of a scenario axis (ensemble) are set for all scenarios
+    def set_border_flow(self, border_flow):
+        border_cells = list(self.network_border_cells)
+        flows = list(self.network_border_flow)
+        row_shape = self.network_border_flow.shape[1:]
+        for segment_id, segment_flow in border_flow.items():
+            first = self.segment_map[segment_id][self.FIRST]
+            flow = np.array(ListMethods.__fill_slots__(segment_flow, self.settings.STEPS), dtype=np.float64) / 3600
+            flow = np.broadcast_to(flow.reshape(flow.shape + (1,) * (len(row_shape) - 1)), row_shape)
+            if first in border_cells:
+                flows[border_cells.index(first)] = flow
+            else:
+                border_cells.append(first)
+                flows.append(flow)
+        self.border_cells = np.array(border_cells, dtype=np.int64)
+        self.border_flow = np.array(flows, dtype=np.float64).reshape((len(border_cells),) + row_shape)
 
     def mid(a, b, c):
         return median([a, b, c])
 
+    # log, KPIs and the sums they need, for the current shape of the state (vector or ensemble matrix)
+    def init_recording(self):
+        self.init_log()
+        self.init_kpis()
+        if self.kpis is not None or self.log_sums is not None:
+            self.cell_sums = CellSums(np.shape(self.cells))
+        else:
+            self.cell_sums = None
+
+    # preallocates the log, one row per logged second, either in RAM or as a memory-mapped .npy file
+    # next to the csv file (settings.ini: LOG_STORAGE = ram | memmap).
+    # While streaming only a ring of queue depth rows is kept, the memory does not grow with the run length
+    def init_log(self):
+        shape = (self.get_log_steps(),) + np.shape(self.cells)
+        self.log_ring = self.result_sink is not None
+        if self.log_ring:
+            shape = (min(shape[0], max(1, self.result_sink.queue_depth)),) + shape[1:]
+            self.log = np.zeros(shape)
+        elif self.settings.LOG_STORAGE == "memmap":
+            log_path = os.path.splitext(self.csv_path)[0] + "_log.npy"
+            self.log = np.lib.format.open_memmap(log_path, mode='w+', dtype=np.float64, shape=shape)
+        else:
+            self.log = np.zeros(shape)
+        self.log_count = 0
+        # LOG_MODE = average: a row is the mean of the logging window instead of the state at its start
+        if self.settings.LOG_MODE == "average" and len(self.log) > 0:
+            self.log_sums = CellSums(np.shape(self.cells))
+            self.flow_log = np.zeros(shape)
+        else:
+            self.log_sums = None
+            self.flow_log = None
+
+    # number of seconds s < total seconds with s % LOGGING_INTERVAL == 0, no rows in the KPI-only mode
+    def get_log_steps(self):
+        if self.settings.KPI_MODE == "only":
+            return 0
+        return math.ceil(self.get_total_seconds() / self.settings.LOGGING_INTERVAL)
+
+    # per segment and interval KPIs, updated after every step (settings.ini: KPI_MODE = off | on | only)
+    def init_kpis(self):
+        if self.settings.KPI_MODE == "off":
+            self.kpis = None
+            return
+        cell_length = np.asarray(self.velo) * self.settings.TIME_STEP
+        self.kpis = SegmentKPIs(self.segment_map, self.FIRST, cell_length, self.get_border_out_cells(),
+                                self.settings.TIME_STEP, self.settings.STEPS, self.cells)
+
+    # cells whose vehicles leave the network (border_exit)
+    def get_border_out_cells(self):
+        return np.zeros(len(self.velo), dtype=bool)
+
+    # detectors of the yml file, see VirtualDetectors.map_detectors
+    def set_detectors(self, detectors_yaml):
+        self.detectors_yaml = detectors_yaml
+        if not detectors_yaml:
+            self.detectors = None
+            return
+        cell_length = np.asarray(self.velo) * self.settings.TIME_STEP
+        detectors = VirtualDetectors.map_detectors(detectors_yaml, self.segment_map, self.FIRST, self.LAST,
+                                                   cell_length, self.settings.LOGGING_INTERVAL)
+        self.detectors = VirtualDetectors(detectors, self.get_total_seconds(), np.shape(self.cells))
+
+    def get_detectors(self):
+        if self.detectors is None:
+            return {}
+        return self.detectors.get_results()
+
+    def get_kpis(self):
+        if self.kpis is None:
+            return {}
+        return self.kpis.get_results()
+
+    # writes the next row of the log: a copy of the cells, or in the averaged mode the mean vehicles
+    # and outflow of the logging window that ends now
     def sim_log(self):
-        self.log.append(self.cells)
+        if self.log_count >= self.get_log_steps():  # KPI-only mode
+            return
+        # the index wraps around in the ring of a streamed log
+        index = self.log_count % len(self.log)
+        row = self.log[index]
+        if self.log_sums is not None:
+            if self.log_sums.step_count == 0:  # start of the first window
+                return
+            np.divide(self.log_sums.vehicle_sum, self.log_sums.step_count, out=row)
+            np.divide(self.log_sums.outflow_sum, self.log_sums.step_count, out=self.flow_log[index])
+            self.log_sums.reset()
+            if self.flow_sink is not None:
+                self.flow_sink.put(self.flow_log[index])
+        else:
+            row[...] = self.cells
+        self.log_count += 1
+        if self.result_sink is not None:
+            self.result_sink.put(row)
+
+    # adds the sums of the steps since the last boundary to the KPIs and the averaged log
+    def drain_cell_sums(self):
+        if self.cell_sums is None or self.cell_sums.step_count == 0:
+            return
+        if self.kpis is not None:
+            self.kpis.add(self.cell_sums)
+        if self.log_sums is not None:
+            self.log_sums.add(self.cell_sums)
+        self.cell_sums.reset()
+
+    # mean outflow (veh/s) of each logging window in the averaged mode
+    def get_flow_log(self):
+        if self.flow_log is None:
+            return None
+        if self.log_ring:
+            return self.read_streamed_rows(self.get_flow_store_path())
+        return self.flow_log[:self.log_count]
+
+    # the logged rows, a view of the log. A streamed log is read from the result store after the run
+    def get_log(self):
+        if self.log_ring:
+            return self.read_streamed_rows(self.get_result_store_path())
+        return self.log[:self.log_count]
+
+    def read_streamed_rows(self, store_path):
+        if self.result_sink is not None:
+            raise RuntimeError(f"The log is streamed to {store_path}, its rows can be read after the run.")
+        if self.log_count == 0:
+            return self.log[:0]
+        return ResultStore(store_path).get_rows(0, self.log_count)
 
     def init_flows(self):
         pass
     def import_yaml_network(self, segments):
+        if isinstance(segments, CompiledNetwork):
+            return self.load_compiled_network(segments)
         logging.info("Start of yml to object conversion!")
+        self.cell_count = 0
+        self.segment_blocks = {name: [] for name in self.CELL_VECTORS}
+        self.border_cells = []
+        self.border_flow = []
         for key, values in segments.items():
             try:
                 self.create_segment_cells(key, values)
 
             except IndexError as ex:
                 logging.error(ex, "Index in yml file list is not correct! A list is too big!")
+        # one concatenation per vector instead of one append per cell
+        for name, blocks in self.segment_blocks.items():
+            setattr(self, name, np.concatenate(blocks))
+        self.segment_blocks = None
+        self.border_cells = np.array(self.border_cells, dtype=np.int64)
+        self.border_flow = np.array(self.border_flow, dtype=np.float64).reshape(len(self.border_cells),
+                                                                                self.settings.STEPS)
         self.print_segment_map()
         logging.info("Finalized Conversion!")
         return self
 
+    # vectors, segment_map and adjacent matrix of a compiled network (traffic.vector.compiled_network)
+    def load_compiled_network(self, network):
+        self.compiled_network = network
+        # copies, the engines change the vectors in place and a compiled network can be used by several simulations
+        for name in NETWORK_VECTORS:
+            setattr(self, name, np.array(network.arrays[name]))
+        self.segment_map = network.segment_map
+        self.adjacent_matrix = network.get_adjacent_matrix()
+        self.print_segment_map()
+        return self
+
+    # topology of the adjacent matrix, taken from the compiled network if there is one
+    def get_topology(self):
+        if self.compiled_network is not None:
+            return self.compiled_network.get_topology()
+        return NetworkTopology(self.adjacent_matrix)
+
+    # creates the parameter blocks of all cells of a segment, all cells of a segment are equal
     def create_segment_cells(self, key, values: dict):
-        index = len(self.cells)
+        index = self.cell_count
         segment_length = values.pop("length")
         velo_free = values["velocity_free"]
         cell_length = (velo_free / 3.6) * self.settings.TIME_STEP
@@ -95,66 +368,321 @@ class VectorCTM(SimulationInterface, visualize.IVisualize.IVisualizeGraph, visua
         self.segment_map[key][self.PREDECESSORS] = values['predecessor']
         self.segment_map[key][self.SUCCESSORS] = values['successor']
         self.segment_map[key][self.LAST] = index + cell_count - 1
-
-        for i in range(0, cell_count):
-            total_index = index + i
-            self.cells.append(0.0)
-            self.lanes.append(values['lanes'])
-            self.velo.append(values['velocity_free'] / 3.6)
-            self.max_flow.append(self.settings.FLOW_PER_LANE * self.lanes[total_index])
-            self.max_veh.append(cell_length * self.lanes[total_index] / self.settings.CAR_LENGTH)
-            self.delta.append(self.settings.WAVE_COEFFICIENT / (values['velocity_free'] / 3.6))
-            self.send.append(min(self.max_flow[total_index], self.cells[total_index]))
-            self.receive.append(min(self.max_flow[total_index],
-                                    self.delta[total_index] * (self.max_veh[total_index] - self.cells[total_index])))
-            self.flow.append(0.0)
-
-            # set border flow
-            if i == 0:
-                if 'border_flow' in values.keys():
-                    self.border_flow.append(ListMethods.__fill_slots__(values['border_flow']))
-                else:
-                    self.border_flow.append([0] * self.settings.STEPS)
-
-            else:
-                self.border_flow.append([0] * self.settings.STEPS)
+        self.cell_count += cell_count
+
+        lanes = values['lanes']
+        max_flow = self.settings.FLOW_PER_LANE * lanes
+        max_veh = cell_length * lanes / self.settings.CAR_LENGTH
+        delta = self.settings.WAVE_COEFFICIENT / (values['velocity_free'] / 3.6)
+        blocks = self.segment_blocks
+        blocks["cells"].append(np.zeros(cell_count))
+        blocks["lanes"].append(np.full(cell_count, lanes))
+        blocks["velo"].append(np.full(cell_count, values['velocity_free'] / 3.6))
+        blocks["max_flow"].append(np.full(cell_count, max_flow))
+        blocks["max_veh"].append(np.full(cell_count, max_veh))
+        blocks["delta"].append(np.full(cell_count, delta))
+        blocks["send"].append(np.full(cell_count, min(max_flow, 0.0)))
+        blocks["receive"].append(np.full(cell_count, min(max_flow, delta * (max_veh - 0.0))))
+        blocks["flow"].append(np.zeros(cell_count))
+
+        # set border flow, only the first cell of a segment can have a border flow
+        if 'border_flow' in values.keys():
+            self.border_cells.append(index)
+            self.border_flow.append(ListMethods.__fill_slots__(values['border_flow'], self.settings.STEPS))
+
+    # lazy view of the log, see traffic.vector.results.Results
+    def get_results(self):
+        if self.results_view is None or len(self.results_view) != self.log_count:
+            self.results_view = Results(self.get_log(), self.segment_map, self.FIRST, self.LAST, self.PREDECESSORS,
+                                        self.SUCCESSORS, self.max_veh, self.lanes)
+        return self.results_view
 
     def get_results_dict(self):
         if self.results:
             return self.results
-        self.results = {}
-        np_log = np.array(self.log)
-        for time_step in range(0, len(self.log)):
-            self.results[time_step] = {}
-            for key, segment in self.segment_map.items():
-                self.results[time_step][key] = {
-                    self.VEHICLES: np_log[time_step, segment[self.FIRST]:segment[self.LAST]],
-                    self.PREDECESSORS: segment[self.PREDECESSORS],
-                    self.SUCCESSORS: segment[self.SUCCESSORS],
-                    self.MAX_VEHICLE: sum(self.max_veh[segment[self.FIRST]:segment[self.LAST]])}
+        self.results = self.build_results_dict(self.get_results())
         return self.results
 
+    def build_results_dict(self, results):
+        results_dict = {}
+        for time_step in range(0, len(results)):
+            results_dict[time_step] = {}
+            for key in results.segment_ids:
+                results_dict[time_step][key] = {
+                    self.VEHICLES: results.segment_timestep(key, time_step),
+                    self.PREDECESSORS: results.predecessors[key],
+                    self.SUCCESSORS: results.successors[key],
+                    self.MAX_VEHICLE: results.max_vehicle(key)}
+        return results_dict
+
     def get_results_np(self):
-        return np.array(self.log)
+        return self.get_log()
 
     def get_segments(self):
+        return self.build_segments(self.get_results())
+
+    def build_segments(self, results):
         segments = {}
-        np_log = np.array(self.log)
-        for key, segment in self.segment_map.items():
-            segments[key] = {self.LOG: np_log[:, segment[self.FIRST]:segment[self.LAST]],
-                             self.PREDECESSORS: segment[self.PREDECESSORS],
-                             self.SUCCESSORS: segment[self.SUCCESSORS],
-                             self.MAX_VEHICLE: self.max_veh[segment[self.FIRST]:segment[self.LAST]],
-                             self.LANES: self.lanes[segment[self.FIRST]:segment[self.LAST]]}
+        for key in results.segment_ids:
+            segments[key] = {self.LOG: results.segment(key),
+                             self.PREDECESSORS: results.predecessors[key],
+                             self.SUCCESSORS: results.successors[key],
+                             self.MAX_VEHICLE: results.max_vehicles(key),
+                             self.LANES: results.segment_lanes(key)}
         return segments
 
+    # FIRST/LAST cell index of every segment
+    def get_segment_ranges(self):
+        return {key: (segment[self.FIRST], segment[self.LAST]) for key, segment in self.segment_map.items()}
 
+    def get_result_store_path(self):
+        return os.path.splitext(self.csv_path)[0]
 
+    # result store of the streamed flow log (LOG_MODE = average), inside the result store
+    def get_flow_store_path(self):
+        return os.path.join(self.get_result_store_path(), "flow_log")
 
+    # saves the log as binary result store (resources.ResultStore), a directory next to the csv path
     def save_results(self):
-        print("Saving results to: ", self.csv_path)
-        np.savetxt(self.csv_path, self.log, delimiter=';')
-        print("Log saved to: ", self.csv_path)
+        store_path = self.get_result_store_path()
+        if "stream_path" in self.run_statistics:
+            print("Results already streamed to: ", store_path)
+            return store_path
+        print("Saving results to: ", store_path)
+        writer = ResultStoreWriter(store_path, np.shape(self.cells), self.get_name(), self.settings,
+                                   self.get_segment_ranges())
+        writer.append(self.get_log())
+        writer.close()
+        if self.kpis is not None:
+            self.kpis.save(os.path.join(store_path, "kpis.npz"))
+        if self.detectors is not None:
+            self.detectors.save(os.path.join(store_path, "detectors.npz"))
+        if self.flow_log is not None:
+            np.save(os.path.join(store_path, "flow_log.npy"), self.get_flow_log())
+        print("Log saved to: ", store_path)
+        return store_path
+
+    def get_checkpoint_path(self):
+        return self.get_result_store_path() + "_checkpoint.npz"
+
+    # writes the state of the simulation to a .npz file: the state vectors, border flows, sim_step, second,
+    # the log cursor and the logged rows (with LOG_STORAGE = memmap only the path of the log file),
+    # the sums of the KPIs, of the averaged log and the detector values.
+    # The file is written next to the target and renamed, so an interrupted checkpoint keeps the last one.
+    def checkpoint(self, path):
+        arrays = {name: np.asarray(getattr(self, name)) for name in self.CHECKPOINT_VECTORS}
+        meta = {"version": self.CHECKPOINT_VERSION, "engine": self.get_name(), "sim_step": self.sim_step,
+                "second": self.second, "log_count": self.log_count, "log_path": None,
+                "settings": {name: getattr(self.settings, name) for name in self.CHECKPOINT_SETTINGS}}
+        if self.log_ring:
+            # the rows are in the streamed result store, written up to now
+            for sink in (self.result_sink, self.flow_sink):
+                if sink is not None:
+                    sink.flush()
+            meta["stream_path"] = self.get_result_store_path()
+        elif isinstance(self.log, np.memmap):
+            self.log.flush()
+            meta["log_path"] = self.log.filename
+        else:
+            arrays["log"] = self.get_log()
+        if self.flow_log is not None and not self.log_ring:
+            arrays["flow_log"] = self.get_flow_log()
+        for prefix, part in self.get_checkpoint_parts().items():
+            if part is not None:
+                arrays.update({prefix + name: value for name, value in part.get_state().items()})
+        arrays["meta"] = np.array(json.dumps(meta))
+        temporary_path = path + ".tmp"
+        with open(temporary_path, "wb") as file:
+            np.savez(file, **arrays)
+        os.replace(temporary_path, path)
+        self.checkpoint_second = self.second
+        self.run_statistics["checkpoint_path"] = path
+        self.run_statistics["checkpoint_second"] = self.second
+        logging.info(f"Checkpoint at second {self.second} written to {path}")
+        return path
+
+    # parts with their own state in a checkpoint, prefix -> CellSums, SegmentKPIs or VirtualDetectors
+    def get_checkpoint_parts(self):
+        return {"cell_sums_": self.cell_sums, "log_sums_": self.log_sums, "kpis_": self.kpis,
+                "detectors_": self.detectors}
+
+    # continues a simulation of the same network and settings at the state of a checkpoint, simulate() then
+    # runs the remaining seconds with the same results as an uninterrupted run. The engine may differ.
+    def restore(self, path):
+        with np.load(path, allow_pickle=False) as data:
+            arrays = {name: data[name] for name in data.files}
+        meta = json.loads(str(arrays.pop("meta")))
+        settings = {name: getattr(self.settings, name) for name in self.CHECKPOINT_SETTINGS}
+        if meta["version"] != self.CHECKPOINT_VERSION or meta["settings"] != settings:
+            raise ValueError(f"Checkpoint {path} was written with other settings: {meta['settings']}")
+        if np.shape(arrays["cells"]) != np.shape(self.cells):
+            raise ValueError(f"Checkpoint {path} has {np.shape(arrays['cells'])} cells, "
+                             f"the network has {np.shape(self.cells)}.")
+        for name in self.CHECKPOINT_VECTORS:
+            setattr(self, name, np.array(arrays[name]))
+        self.sim_step = meta["sim_step"]
+        self.second = meta["second"]
+        self.set_border_inflow(max(self.sim_step - 1, 0))
+        self.results = {}
+        self.results_view = None
+
+        rows, flow_rows = self.get_checkpoint_rows(meta, arrays)
+        if self.log_ring:
+            # a streamed result store gets the rows logged before the checkpoint first
+            self.log_count = meta["log_count"]
+            for sink, sink_rows in [(self.result_sink, rows), (self.flow_sink, flow_rows)]:
+                for row in (sink_rows if sink is not None else []):
+                    sink.put(row)
+        elif meta["log_path"] is not None:
+            self.restore_log_file(meta["log_path"])
+            self.log_count = meta["log_count"]
+        else:
+            self.log_count = meta["log_count"]
+            if self.log_count > 0:
+                self.log[:self.log_count] = rows
+        if self.flow_log is not None and not self.log_ring and self.log_count > 0:
+            self.flow_log[:self.log_count] = flow_rows
+        for prefix, part in self.get_checkpoint_parts().items():
+            if part is not None:
+                part.set_state({name[len(prefix):]: value for name, value in arrays.items() if name.startswith(prefix)})
+        self.checkpoint_second = self.second
+        logging.info(f"Restored checkpoint {path} at second {self.second}")
+
+    # rows and flow log rows logged before a checkpoint: in the checkpoint, in the memory-mapped log
+    # or in the streamed result store of the interrupted run
+    def get_checkpoint_rows(self, meta, arrays):
+        log_count = meta["log_count"]
+        if meta.get("stream_path") is None:
+            rows = arrays.get("log")
+            if meta["log_path"] is not None:
+                rows = np.load(meta["log_path"], mmap_mode="r")[:log_count]
+            return rows, arrays.get("flow_log")
+        if log_count == 0:
+            return [], []
+        rows = ResultStore(meta["stream_path"]).get_rows(0, log_count)
+        flow_path = os.path.join(meta["stream_path"], "flow_log")
+        flow_rows = ResultStore(flow_path).get_rows(0, log_count) if os.path.isdir(flow_path) else None
+        return rows, flow_rows
+
+    # continues the memory-mapped log of the interrupted run, the results are written next to it
+    def restore_log_file(self, log_path):
+        self.discard_empty_log()
+        self.log = np.load(log_path, mmap_mode="r+")
+        self.csv_path = log_path[:-len("_log.npy")] + ".csv"
+
+    # removes the memory-mapped log file of this simulation if nothing was logged into it yet
+    def discard_empty_log(self):
+        if not isinstance(self.log, np.memmap) or self.log_count > 0:
+            return
+        log_path = self.log.filename
+        self.log = []
+        try:
+            os.remove(log_path)
+        except OSError:
+            pass
+
+    # starts the run with the vehicles of a previous run instead of empty cells, so no warm-up is simulated.
+    # source: STEADY_STATE (solve_steady_state()) or a state snapshot, see load_state_snapshot()
+    def warm_start(self, source, row=-1):
+        if source == self.STEADY_STATE:
+            initial_state, steps, converged = self.solve_steady_state()
+        else:
+            initial_state, steps, converged = self.load_state_snapshot(source, row), 0, True
+        self.reset(initial_state=initial_state)
+        self.run_statistics["warm_start"] = source
+        if source == self.STEADY_STATE:
+            self.run_statistics["warm_start_steps"] = steps
+            self.run_statistics["warm_start_converged"] = converged
+        logging.info(f"Warm start from {source}, {float(np.sum(self.cells)):.1f} vehicles in the network")
+
+    # vehicles per cell of a previous run: the cells of a checkpoint (.npz, e.g. written by checkpoint() at the end
+    # of the run), a row of a result store directory (save_results()) or of a .npy log, or a saved state (.npy)
+    def load_state_snapshot(self, path, row=-1):
+        if os.path.isdir(path):
+            store = ResultStore(path)
+            # only the row is read from the chunks
+            index = row + len(store) if row < 0 else row
+            if not 0 <= index < len(store):
+                raise IndexError(f"Row {row} is not in the result store {path} with {len(store)} rows.")
+            state = store.get_rows(index, index + 1)[0]
+        else:
+            data = np.load(path, allow_pickle=False)
+            if isinstance(data, np.lib.npyio.NpzFile):
+                with data:
+                    state = np.array(data["cells"])
+            else:
+                state = data
+            if np.ndim(state) > np.ndim(self.cells) or np.shape(state)[:1] != np.shape(self.cells)[:1]:
+                state = state[row]
+        state = np.array(state, dtype=np.float64)
+        if np.shape(state)[:1] != np.shape(self.cells)[:1]:
+            raise ValueError(f"State snapshot {path} has {np.shape(state)} cells, "
+                             f"the network has {np.shape(self.cells)}.")
+        return state
+
+    # state the network reaches under the constant border flow of the given interval.
+    # Start: the free flow state, every cell passes its vehicles on in one step, so n = P A n + b
+    # (P: diverge percentages, b: border inflow), capped at the capacity of the cells, the border out cells are empty.
+    # The network is then simulated until no cell changes by more than tolerance vehicles per step
+    # (congestion builds up) or max_steps (default: the length of the simulation) are reached.
+    # Only the state vectors are changed, no log or result path is created, start the run with reset(initial_state=...)
+    # Returns the state, the simulated steps and whether it converged
+    def solve_steady_state(self, interval=0, tolerance=1e-6, max_steps=None):
+        max_steps = self.get_total_seconds() if max_steps is None else max_steps
+        self.set_border_inflow(interval)
+        cell_count = len(self.cells)
+        percentage = np.broadcast_to(np.ravel(getattr(self, "diverge_percentage", 1.0)), (cell_count,))
+        matrix = sparse.identity(cell_count, format="csc") \
+            - sparse.diags(percentage) @ sparse.csr_matrix(self.adjacent_matrix, dtype=np.float64)
+        try:
+            free_flow = splu(matrix.tocsc()).solve(np.asarray(self.border_inflow, dtype=np.float64))
+        except RuntimeError:
+            # singular (e.g. a cycle without losses): simulated from empty cells
+            free_flow = np.zeros(np.shape(self.border_inflow))
+        free_flow[self.get_border_out_cells()] = 0.0
+        capacity = np.broadcast_to(np.minimum(self.max_flow, self.max_veh), np.shape(free_flow))
+        free_flow = np.clip(free_flow, 0.0, capacity)
+
+        self.set_state(free_flow)
+        self.set_border_inflow(interval)
+        self.update_border_flow()
+        cell_sums, self.cell_sums = self.cell_sums, None
+        steps, converged = 0, False
+        while steps < max_steps and not converged:
+            step_count = min(self.STEADY_STATE_CHECK_STEPS, max_steps - steps)
+            self.run_steps(step_count - 1)
+            previous = np.array(self.cells)
+            self.run_steps(1)
+            steps += step_count
+            converged = bool(np.max(np.abs(self.cells - previous), initial=0.0) <= tolerance)
+        self.cell_sums = cell_sums
+        return np.array(self.cells), steps, converged
+
+    # streams every logged state to a result store at get_result_store_path() during the simulation,
+    # called before the run. The log is then a ring of queue_depth rows, get_log() reads the store after the run
+    def stream_results(self, queue_depth=8):
+        self.discard_empty_log()
+        self.result_sink = StreamingResultWriter(self.get_result_store_path(), self.get_name(),
+                                                 self.settings, self.get_segment_ranges(), queue_depth)
+        self.init_log()
+        if self.flow_log is not None:
+            self.flow_sink = StreamingResultWriter(self.get_flow_store_path(), self.get_name(),
+                                                   self.settings, self.get_segment_ranges(), queue_depth)
+
+    # completes the streamed result store and adds its back-pressure statistics to the run statistics
+    def close_result_sink(self):
+        if self.flow_sink is not None:
+            self.flow_sink.close()
+            self.flow_sink = None
+        if self.result_sink is None:
+            return
+        self.run_statistics.update(self.result_sink.close())
+        self.result_sink = None
+
+    def export_csv(self):
+        print("Exporting results to: ", self.csv_path)
+        np.savetxt(self.csv_path, self.get_log(), delimiter=';')
+        print("Log exported to: ", self.csv_path)
 
     # updates the vehiclenumber in each cell
     def calc_cells(self):
@@ -167,11 +695,17 @@ class VectorCTM(SimulationInterface, visualize.IVisualize.IVisualizeGraph, visua
 
     # calculates the receiving flow capacity for each cell
     def calc_receive(self):
-        self.receive = np.maximum(np.minimum(self.max_flow, self.delta * (self.max_veh - self.cells)),
-                                  np.zeros(len(self.cells)))
+        self.receive = np.maximum(np.minimum(self.max_flow, self.delta * (self.max_veh - self.cells)), 0.0)
 
     def update_border_flow(self):
-        self.current_border_flow = np.minimum(self.border_flow[:, self.sim_step - 1], self.receive)
+        self.current_border_flow = np.minimum(self.border_inflow, self.receive)
+
+    # builds the dense inflow vector of the given simulation step from the border flow table,
+    # it stays constant until the next interval
+    def set_border_inflow(self, step):
+        border_inflow = np.zeros((len(self.cells),) + self.border_flow.shape[2:])
+        border_inflow[self.border_cells] = self.border_flow[:, step]
+        self.border_inflow = border_inflow
 
     @abstractmethod
     def create_adjacent_matrix(self):
@@ -182,25 +716,89 @@ class VectorCTM(SimulationInterface, visualize.IVisualize.IVisualizeGraph, visua
     def calc_flows(self):
         pass
 
+    # checkpoint_intervals: writes a checkpoint every n intervals to checkpoint_path
+    # (default: CHECKPOINT_INTERVALS of the settings, 0 = off, and get_checkpoint_path())
     @abstractmethod
-    def simulate(self):
-        for second in range(0, self.settings.STEPS * self.settings.INTERVAL):
-            self.second = second
-            # print("Receive", receive)
-            # print("Send", send)
-            # print("second", second)
-            if second % self.settings.INTERVAL == 0:
-
-                self.sim_step += 1
-                print("Simulating t = ", self.sim_step)
-            if second % self.settings.LOGGING_INTERVAL == 0:
-                self.sim_log()
-
-            self.calc_flows()
-            self.calc_cells()
-            self.calc_send()
-            self.calc_receive()
-            self.update_border_flow()
+    def simulate(self, checkpoint_intervals=None, checkpoint_path=None):
+        if checkpoint_intervals is None:
+            checkpoint_intervals = self.settings.CHECKPOINT_INTERVALS
+        self.checkpoint_seconds = checkpoint_intervals * self.settings.INTERVAL
+        self.checkpoint_path = checkpoint_path or self.get_checkpoint_path()
+        self.advance(self.get_total_seconds() - self.second)
+
+    # closes the last interval and logging window, then writes the log to disk and completes the streamed results.
+    # Called by advance() at the end of the simulation, nothing happens if it is called again
+    def finish(self):
+        self.drain_cell_sums()
+        if self.kpis is not None:
+            self.kpis.close_interval(self.cells)
+        if self.log_sums is not None:
+            self.sim_log()
+        if isinstance(self.log, np.memmap):
+            self.log.flush()
+        self.close_result_sink()
+
+    def get_total_seconds(self):
+        return self.settings.STEPS * self.settings.INTERVAL
+
+    # simulates the given number of seconds.
+    # The seconds between two boundaries (interval or logging) are passed to run_steps() at once,
+    # Python only regains control at the boundaries, where the border flow changes or the state is logged.
+    def advance(self, seconds):
+        end = min(self.second + seconds, self.get_total_seconds())
+        while self.second < end:
+            if self.checkpoint_seconds and self.second % self.checkpoint_seconds == 0 \
+                    and self.second not in (0, self.checkpoint_second):
+                self.checkpoint(self.checkpoint_path)
+            self.handle_boundary()
+            step_count = min(self.next_boundary(), end) - self.second
+            self.run_steps(step_count)
+            self.second += step_count
+        if self.second == self.get_total_seconds():
+            self.finish()
+
+    # interval and logging bookkeeping, called before the second self.second is simulated
+    def handle_boundary(self):
+        # only at boundaries, the sums are added in the same order after restoring a checkpoint of any second
+        if self.is_boundary():
+            self.drain_cell_sums()
+        if self.second % self.settings.INTERVAL == 0:
+            if self.kpis is not None:
+                self.kpis.close_interval(self.cells)
+            self.sim_step += 1
+            print("Simulating t = ", self.sim_step)
+            self.set_border_inflow(self.sim_step - 1)
+        if self.second % self.settings.LOGGING_INTERVAL == 0:
+            self.sim_log()
+        if self.detectors is not None:
+            self.detectors.record(self.second, self.cells, self.flow, self.max_veh)
+
+    def is_boundary(self):
+        return any(self.second % interval == 0 for interval in self.boundary_intervals())
+
+    def boundary_intervals(self):
+        intervals = [self.settings.INTERVAL, self.settings.LOGGING_INTERVAL]
+        if self.detectors is not None:
+            intervals.extend(self.detectors.intervals())
+        return intervals
+
+    # first second after self.second at which handle_boundary() has something to do
+    def next_boundary(self):
+        return min((self.second // interval + 1) * interval for interval in self.boundary_intervals())
+
+    def run_steps(self, step_count):
+        for _ in range(step_count):
+            self.step()
+            if self.cell_sums is not None:
+                self.cell_sums.accumulate(self.cells, self.flow, self.border_exit)
+
+    # simulates one second of the whole network
+    def step(self):
+        self.calc_flows()
+        self.calc_cells()
+        self.calc_send()
+        self.calc_receive()
+        self.update_border_flow()
 
     def print_segment_map(self):
         # for key in self.segment_map.keys():
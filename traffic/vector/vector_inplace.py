@@ -0,0 +1,157 @@
+import numpy as np
+from scipy.sparse import _sparsetools
+
+from traffic.vector.vector_flow import VectorizedFlow
+
+
+class VectorizedFlowInPlace(VectorizedFlow):
+    '''
+    VectorizedFlow without temporary arrays: all vectors of the step are preallocated work buffers,
+    which are written with the out= argument of the NumPy ufuncs.
+    The sparse matrix vector products are computed into these buffers by the SciPy CSR kernel,
+    the transposed adjacent matrix is computed once and cached.
+    The mid of three values is computed branch-free as max(min(a, b), min(max(a, b), c)).
+    The results are the same as the ones of VectorizedFlow.
+    '''
+
+    def __init__(self, yaml_input, config=None):
+        self.adjacent_matrix_t = None
+        self.adjacent_float = None
+        self.merge_partner = None
+        self.diverge_first = None
+        self.diverge_second = None
+        self.send_pred = None
+        self.receive_succ = None
+        self.capacity_f = None
+        self.bool_buffer = None
+        self.mask_f = None
+        self.ord_f = None
+        self.diverge_f = None
+        self.inflow = None
+        self.ratio = None
+        self.tmp_a = None
+        self.tmp_b = None
+        self.tmp_c = None
+        self.border_exit = None
+        super().__init__(yaml_input, config)
+
+    def init_flows(self):
+        super().init_flows()
+        self.init_buffers()
+
+    def init_buffers(self):
+        cell_count = len(self.cells)
+        self.adjacent_float = self.adjacent_matrix.astype(np.float64).tocsr()
+        self.adjacent_float.sort_indices()
+        self.adjacent_matrix_t = self.adjacent_float.transpose().tocsr()
+        self.adjacent_matrix_t.sort_indices()
+
+        # merge partner and diverge targets as gather indices, rows without link point to the cell itself
+        cell_index = np.arange(cell_count)
+        self.merge_partner = np.where(self.bool_merge, self.topology.merge_partner, cell_index)
+        self.diverge_first = np.where(self.bool_diverge, self.topology.diverge_first, cell_index)
+        self.diverge_second = np.where(self.bool_diverge, self.topology.diverge_second, cell_index)
+
+        self.cells = np.array(self.cells, dtype=np.float64)
+        self.send = np.array(self.send, dtype=np.float64)
+        self.receive = np.array(self.receive, dtype=np.float64)
+        self.flow = np.zeros(cell_count)
+        self.current_border_flow = np.array(self.current_border_flow, dtype=np.float64)
+
+        self.send_pred = np.zeros(cell_count)
+        self.receive_succ = np.zeros(cell_count)
+        self.capacity_f = np.zeros(cell_count)
+        self.bool_merge_capacity = np.zeros(cell_count, dtype=bool)
+        self.bool_buffer = np.zeros(cell_count, dtype=bool)
+        # masks as float vectors, multiplying a float vector with a bool vector would create a casted copy
+        self.mask_f = np.zeros(cell_count)
+        self.ord_f = self.bool_ord.astype(np.float64)
+        self.diverge_f = self.bool_diverge.astype(np.float64)
+        self.inflow = np.zeros(cell_count)
+        self.ratio = np.zeros(cell_count)
+        self.tmp_a = np.zeros(cell_count)
+        self.tmp_b = np.zeros(cell_count)
+        self.tmp_c = np.zeros(cell_count)
+        self.border_exit = np.zeros(cell_count)
+
+    @staticmethod
+    def matvec(matrix, vector, out):
+        # out = matrix.dot(vector) without allocating the result
+        out.fill(0.0)
+        _sparsetools.csr_matvec(matrix.shape[0], matrix.shape[1], matrix.indptr, matrix.indices, matrix.data,
+                                vector, out)
+
+    def is_capacity_sufficient(self):
+        self.matvec(self.adjacent_float, self.send, self.send_pred)
+        np.greater_equal(self.receive, self.send_pred, out=self.bool_buffer)
+        np.copyto(self.tmp_a, self.bool_buffer)
+        self.matvec(self.adjacent_matrix_t, self.tmp_a, self.capacity_f)
+        np.not_equal(self.capacity_f, 0.0, out=self.bool_merge_capacity)
+
+    def calc_flows(self):
+        self.is_capacity_sufficient()
+        # the transposed product is needed three times, it is computed once
+        self.matvec(self.adjacent_matrix_t, self.receive, self.receive_succ)
+
+        # ordinary flow
+        np.minimum(self.send, self.receive_succ, out=self.tmp_a)
+        np.multiply(self.tmp_a, self.ord_f, out=self.flow)
+
+        # merge flow, capacity sufficient
+        np.logical_and(self.bool_merge, self.bool_merge_capacity, out=self.bool_buffer)
+        np.copyto(self.mask_f, self.bool_buffer)
+        np.multiply(self.send, self.mask_f, out=self.tmp_a)
+        np.add(self.flow, self.tmp_a, out=self.flow)
+
+        # merge flow, capacity limited
+        np.multiply(self.merge_percentage, self.receive_succ, out=self.tmp_a)
+        np.take(self.send, self.merge_partner, out=self.tmp_b, mode='clip')
+        np.subtract(self.receive_succ, self.tmp_b, out=self.tmp_b)
+        self.vector_mid_into(self.send, self.tmp_a, self.tmp_b, self.tmp_c)
+        np.logical_not(self.bool_merge_capacity, out=self.bool_buffer)
+        np.logical_and(self.bool_merge, self.bool_buffer, out=self.bool_buffer)
+        np.copyto(self.mask_f, self.bool_buffer)
+        np.multiply(self.tmp_a, self.mask_f, out=self.tmp_a)
+        np.add(self.flow, self.tmp_a, out=self.flow)
+
+        # diverge flow
+        np.divide(self.receive, self.diverge_percentage, out=self.ratio)
+        np.take(self.ratio, self.diverge_first, out=self.tmp_a, mode='clip')
+        np.take(self.ratio, self.diverge_second, out=self.tmp_b, mode='clip')
+        np.minimum(self.tmp_a, self.tmp_b, out=self.tmp_a)
+        np.minimum(self.send, self.tmp_a, out=self.tmp_a)
+        np.multiply(self.tmp_a, self.diverge_f, out=self.tmp_a)
+        np.add(self.flow, self.tmp_a, out=self.flow)
+
+    @staticmethod
+    def vector_mid_into(a, b, c, tmp):
+        # writes the mid of a, b and c into b, c and tmp are overwritten
+        np.minimum(a, b, out=tmp)
+        np.maximum(a, b, out=b)
+        np.minimum(b, c, out=b)
+        np.maximum(tmp, b, out=b)
+
+    def calc_cells(self):
+        self.matvec(self.adjacent_float, self.flow, self.inflow)
+        np.multiply(self.diverge_percentage, self.inflow, out=self.inflow)
+        np.add(self.cells, self.inflow, out=self.cells)
+        np.subtract(self.cells, self.flow, out=self.cells)
+        np.add(self.cells, self.current_border_flow, out=self.cells)
+        np.minimum(self.border_out_flow, self.cells, out=self.border_exit)
+        np.subtract(self.cells, self.border_exit, out=self.cells)
+
+    def calc_send(self):
+        np.minimum(self.cells, self.max_flow, out=self.send)
+
+    def calc_receive(self):
+        np.subtract(self.max_veh, self.cells, out=self.receive)
+        np.multiply(self.delta, self.receive, out=self.receive)
+        np.minimum(self.max_flow, self.receive, out=self.receive)
+        np.maximum(self.receive, 0.0, out=self.receive)
+
+    def update_border_flow(self):
+        np.minimum(self.border_inflow, self.receive, out=self.current_border_flow)
+
+    @staticmethod
+    def get_name():
+        return "Vectorized Calculation with In-Place Buffers"
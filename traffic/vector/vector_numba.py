@@ -0,0 +1,181 @@
+import numpy as np
+
+from traffic.vector.vector_flow import VectorizedFlow
+
+try:
+    import numba
+except ImportError:  # optional dependency, only needed for VectorizedFlowNumba
+    numba = None
+
+
+def jit(function):
+    # compiled kernels are cached on disk (__pycache__), so only the first run pays for the compilation
+    if numba is None:
+        return function
+    return numba.njit(cache=True)(function)
+
+
+@jit
+def mid(a, b, c):
+    return max(min(a, b), min(max(a, b), c))
+
+
+@jit
+def flow_kernel(first, last, send, receive, flow, src_ptr, src_idx, src_val, dst_ptr, dst_idx, dst_val,
+                bool_ord, bool_merge, bool_diverge, merge_partner, merge_percentage,
+                diverge_first, diverge_second, diverge_percentage):
+    # flows of the cells first:last, computed from send and receive of the last second
+    for i in range(first, last):
+        receive_succ = 0.0  # adjacent_matrix.transpose().dot(receive)
+        capacity = 0  # adjacent_matrix.transpose().dot(receive >= adjacent_matrix.dot(send))
+        for k in range(dst_ptr[i], dst_ptr[i + 1]):
+            j = dst_idx[k]
+            receive_succ += dst_val[k] * receive[j]
+            send_pred = 0.0
+            for m in range(src_ptr[j], src_ptr[j + 1]):
+                send_pred += src_val[m] * send[src_idx[m]]
+            if receive[j] >= send_pred:
+                capacity += dst_val[k]
+
+        cell_flow = 0.0
+        if bool_ord[i]:
+            cell_flow += min(send[i], receive_succ)
+        if bool_merge[i]:
+            if capacity != 0:
+                cell_flow += send[i]
+            else:
+                cell_flow += mid(send[i], merge_percentage[i] * receive_succ,
+                                 receive_succ - send[merge_partner[i]])
+        if bool_diverge[i]:
+            cell_flow += min(send[i], min(receive[diverge_first[i]] / diverge_percentage[diverge_first[i]],
+                                          receive[diverge_second[i]] / diverge_percentage[diverge_second[i]]))
+        flow[i] = cell_flow
+
+
+@jit
+def cell_kernel(first, last, cells, send, receive, flow, current_border_flow, border_inflow,
+                src_ptr, src_idx, src_val, diverge_percentage, border_out_flow, max_flow, delta, max_veh,
+                accumulate, vehicle_sum, outflow_sum):
+    # vehicles, send, receive and border flow of the cells first:last, computed from the flows of this second
+    for i in range(first, last):
+        inflow = 0.0  # adjacent_matrix.dot(flow)
+        for m in range(src_ptr[i], src_ptr[i + 1]):
+            inflow += src_val[m] * flow[src_idx[m]]
+        vehicles = cells[i] + diverge_percentage[i] * inflow - flow[i] + current_border_flow[i]
+        border_exit = min(border_out_flow[i], vehicles)
+        vehicles = vehicles - border_exit
+        cells[i] = vehicles
+        if accumulate:
+            vehicle_sum[i] += vehicles
+            outflow_sum[i] += flow[i]
+            outflow_sum[i] += border_exit
+        send[i] = min(vehicles, max_flow[i])
+        receive[i] = max(min(max_flow[i], delta[i] * (max_veh[i] - vehicles)), 0.0)
+        current_border_flow[i] = min(border_inflow[i], receive[i])
+
+
+@jit
+def step_kernel(cells, send, receive, flow, current_border_flow, border_inflow,
+                src_ptr, src_idx, src_val, dst_ptr, dst_idx, dst_val,
+                bool_ord, bool_merge, bool_diverge, merge_partner, merge_percentage,
+                diverge_first, diverge_second, diverge_percentage, border_out_flow,
+                max_flow, delta, max_veh, accumulate, vehicle_sum, outflow_sum):
+    '''
+    One simulated second of VectorizedFlow, fused into two loops over the neighbour index arrays
+    (flow_kernel and cell_kernel, which VectorizedFlowParallel runs on the cell range of each partition).
+    src_* is the CSR representation of the adjacent matrix (predecessors of a cell),
+    dst_* the CSR representation of its transpose (successors of a cell).
+    The arithmetic follows VectorizedFlow.calc_flows/calc_cells operation by operation,
+    so both produce the same results.
+    If accumulate is set, the vehicles and the outflow of each cell are added to vehicle_sum and outflow_sum (CellSums).
+    '''
+    flow_kernel(0, cells.shape[0], send, receive, flow, src_ptr, src_idx, src_val, dst_ptr, dst_idx, dst_val,
+                bool_ord, bool_merge, bool_diverge, merge_partner, merge_percentage,
+                diverge_first, diverge_second, diverge_percentage)
+    cell_kernel(0, cells.shape[0], cells, send, receive, flow, current_border_flow, border_inflow,
+                src_ptr, src_idx, src_val, diverge_percentage, border_out_flow, max_flow, delta, max_veh,
+                accumulate, vehicle_sum, outflow_sum)
+
+
+@jit
+def steps_kernel(step_count, cells, send, receive, flow, current_border_flow, border_inflow,
+                 src_ptr, src_idx, src_val, dst_ptr, dst_idx, dst_val,
+                 bool_ord, bool_merge, bool_diverge, merge_partner, merge_percentage,
+                 diverge_first, diverge_second, diverge_percentage, border_out_flow,
+                 max_flow, delta, max_veh, accumulate, vehicle_sum, outflow_sum):
+    # step_count seconds without leaving the compiled code, the border inflow must not change in between
+    for _ in range(step_count):
+        step_kernel(cells, send, receive, flow, current_border_flow, border_inflow,
+                    src_ptr, src_idx, src_val, dst_ptr, dst_idx, dst_val,
+                    bool_ord, bool_merge, bool_diverge, merge_partner, merge_percentage,
+                    diverge_first, diverge_second, diverge_percentage, border_out_flow,
+                    max_flow, delta, max_veh, accumulate, vehicle_sum, outflow_sum)
+
+
+class VectorizedFlowNumba(VectorizedFlow):
+    '''
+    VectorizedFlow with the whole CTM update compiled into one Numba kernel.
+    All seconds up to the next interval or logging boundary run in one kernel call.
+    Requires the optional package numba.
+    '''
+
+    def __init__(self, yaml_input, config=None):
+        if numba is None:
+            raise ImportError("VectorizedFlowNumba requires the package numba (pip install numba).")
+        self.src_ptr = None
+        self.src_idx = None
+        self.src_val = None
+        self.dst_ptr = None
+        self.dst_idx = None
+        self.dst_val = None
+        self.merge_partner = None
+        self.diverge_first = None
+        self.diverge_second = None
+        self.no_sum = np.zeros(0)
+        super().__init__(yaml_input, config)
+
+    def init_flows(self):
+        super().init_flows()
+        self.init_kernel_arrays()
+
+    def init_kernel_arrays(self):
+        adjacent_matrix = self.adjacent_matrix.tocsr()
+        adjacent_matrix.sort_indices()
+        transposed_matrix = adjacent_matrix.transpose().tocsr()
+        transposed_matrix.sort_indices()
+        self.src_ptr = adjacent_matrix.indptr.astype(np.int64)
+        self.src_idx = adjacent_matrix.indices.astype(np.int64)
+        self.src_val = adjacent_matrix.data.astype(np.float64)
+        self.dst_ptr = transposed_matrix.indptr.astype(np.int64)
+        self.dst_idx = transposed_matrix.indices.astype(np.int64)
+        self.dst_val = transposed_matrix.data.astype(np.float64)
+
+        self.merge_partner = self.topology.merge_partner
+        self.diverge_first = self.topology.diverge_first
+        self.diverge_second = self.topology.diverge_second
+
+        self.cells = np.ascontiguousarray(self.cells, dtype=np.float64)
+        self.send = np.ascontiguousarray(self.send, dtype=np.float64)
+        self.receive = np.ascontiguousarray(self.receive, dtype=np.float64)
+        self.flow = np.ascontiguousarray(self.flow, dtype=np.float64)
+
+    def step(self):
+        self.run_steps(1)
+
+    def run_steps(self, step_count):
+        # the kernel adds to the cell sums (KPIs, averaged log) itself
+        if self.cell_sums is not None:
+            accumulate, vehicle_sum, outflow_sum = True, self.cell_sums.vehicle_sum, self.cell_sums.outflow_sum
+            self.cell_sums.add_steps(step_count)
+        else:
+            accumulate, vehicle_sum, outflow_sum = False, self.no_sum, self.no_sum
+        steps_kernel(step_count, self.cells, self.send, self.receive, self.flow, self.current_border_flow,
+                     self.border_inflow,
+                     self.src_ptr, self.src_idx, self.src_val, self.dst_ptr, self.dst_idx, self.dst_val,
+                     self.bool_ord, self.bool_merge, self.bool_diverge, self.merge_partner, self.merge_percentage,
+                     self.diverge_first, self.diverge_second, self.diverge_percentage, self.border_out_flow,
+                     self.max_flow, self.delta, self.max_veh, accumulate, vehicle_sum, outflow_sum)
+
+    @staticmethod
+    def get_name():
+        return "Vectorized Calculation with Numba Kernel"
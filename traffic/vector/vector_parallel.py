@@ -0,0 +1,218 @@
+import logging
+import multiprocessing
+import os
+import traceback
+import weakref
+from multiprocessing import shared_memory
+
+import numpy as np
+import scipy.sparse as sparse
+
+from traffic.vector.partition import NetworkPartition
+from traffic.vector.vector_numba import VectorizedFlowNumba, flow_kernel, cell_kernel
+
+# state of the simulation, copied into the shared arrays before and out of them after the steps
+STATE_VECTORS = ["cells", "send", "receive", "flow", "current_border_flow"]
+# per cell parameters of the kernels
+PARAMETER_VECTORS = ["bool_ord", "bool_merge", "bool_diverge", "merge_percentage", "diverge_percentage",
+                     "border_out_flow", "max_flow", "delta", "max_veh"]
+# index vectors of the kernels, -1 for cells without link
+INDEX_VECTORS = ["merge_partner", "diverge_first", "diverge_second"]
+
+
+class SharedArrays:
+    '''
+    NumPy arrays in multiprocessing.shared_memory blocks, one block per array.
+    The creating process owns the blocks (close() unlinks them),
+    worker processes attach to them by the description (name, block name, shape, dtype).
+    '''
+
+    def __init__(self, arrays=None):
+        self.blocks = {}
+        self.arrays = {}
+        for name, array in (arrays or {}).items():
+            array = np.ascontiguousarray(array)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            self.blocks[name] = block
+            self.arrays[name] = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+            self.arrays[name][...] = array
+
+    def describe(self):
+        return [(name, block.name, self.arrays[name].shape, self.arrays[name].dtype.str)
+                for name, block in self.blocks.items()]
+
+    @staticmethod
+    def attach(description):
+        shared = SharedArrays()
+        for name, block_name, shape, dtype in description:
+            block = shared_memory.SharedMemory(name=block_name)
+            shared.blocks[name] = block
+            shared.arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+        return shared
+
+    def close(self, unlink=False):
+        self.arrays = {}
+        for block in self.blocks.values():
+            block.close()
+            if unlink:
+                block.unlink()
+        self.blocks = {}
+
+
+def partition_worker(description, first, last, barrier, connection):
+    '''
+    Simulates the cells first:last of the shared arrays. Every step has two phases:
+    the flows of the own cells (reads send and receive of the neighbouring cells) and
+    the cells (reads the flows of the predecessors). All workers wait at a barrier after each phase,
+    so the values of the other partitions are complete before they are read.
+    '''
+    shared = SharedArrays.attach(description)
+    a = shared.arrays
+    try:
+        while (command := connection.recv()) is not None:
+            step_count, accumulate = command
+            for _ in range(step_count):
+                flow_kernel(first, last, a["send"], a["receive"], a["flow"],
+                            a["src_ptr"], a["src_idx"], a["src_val"], a["dst_ptr"], a["dst_idx"], a["dst_val"],
+                            a["bool_ord"], a["bool_merge"], a["bool_diverge"], a["merge_partner"],
+                            a["merge_percentage"], a["diverge_first"], a["diverge_second"], a["diverge_percentage"])
+                barrier.wait()
+                cell_kernel(first, last, a["cells"], a["send"], a["receive"], a["flow"], a["current_border_flow"],
+                            a["border_inflow"], a["src_ptr"], a["src_idx"], a["src_val"], a["diverge_percentage"],
+                            a["border_out_flow"], a["max_flow"], a["delta"], a["max_veh"],
+                            accumulate, a["vehicle_sum"], a["outflow_sum"])
+                barrier.wait()
+            connection.send(None)
+    except Exception:
+        # the other workers would wait at the barrier forever
+        barrier.abort()
+        connection.send(traceback.format_exc())
+    finally:
+        del a
+        shared.close()
+
+
+class VectorizedFlowParallel(VectorizedFlowNumba):
+    '''
+    VectorizedFlowNumba with the network split into PARALLEL_WORKERS partitions (NetworkPartition),
+    each simulated by its own worker process on arrays in shared memory.
+    The cells are renumbered partition by partition, so every worker runs the kernels of VectorizedFlowNumba
+    on a contiguous range. The state is copied into the shared arrays before and out of them after every
+    run_steps() call, the object itself keeps the original cell order (log, KPIs, detectors).
+    The results are the same as the ones of VectorizedFlow.
+    The workers are started by the first run_steps() call and stopped by close() (at the end of simulate()).
+    '''
+
+    def __init__(self, yaml_input, config=None):
+        self.partition = None
+        self.shared = None
+        self.workers = []
+        self.connections = []
+        self.finalizer = None
+        super().__init__(yaml_input, config)
+
+    def get_worker_count(self):
+        return self.settings.PARALLEL_WORKERS or os.cpu_count() or 1
+
+    def init_partition(self):
+        # the partition is kept for the next run after reset()
+        if self.partition is None:
+            self.partition = NetworkPartition(self.adjacent_matrix, self.segment_map, self.FIRST, self.LAST,
+                                              self.get_worker_count())
+        order, position = self.partition.order, self.partition.position
+        # adjacent matrix in the order of the partitions, P A P^T
+        adjacent_matrix = sparse.csr_matrix(self.adjacent_matrix)[order][:, order].tocsr()
+        adjacent_matrix.sort_indices()
+        transposed_matrix = adjacent_matrix.transpose().tocsr()
+        transposed_matrix.sort_indices()
+        arrays = {"src_ptr": adjacent_matrix.indptr.astype(np.int64),
+                  "src_idx": adjacent_matrix.indices.astype(np.int64),
+                  "src_val": adjacent_matrix.data.astype(np.float64),
+                  "dst_ptr": transposed_matrix.indptr.astype(np.int64),
+                  "dst_idx": transposed_matrix.indices.astype(np.int64),
+                  "dst_val": transposed_matrix.data.astype(np.float64)}
+        for name in PARAMETER_VECTORS:
+            arrays[name] = np.asarray(getattr(self, name))[order]
+        for name in INDEX_VECTORS:
+            index = np.asarray(getattr(self, name))[order]
+            arrays[name] = np.where(index >= 0, position[np.maximum(index, 0)], -1)
+        for name in STATE_VECTORS + ["border_inflow", "vehicle_sum", "outflow_sum"]:
+            arrays[name] = np.zeros(len(self.cells))
+        return arrays
+
+    def start_workers(self):
+        self.shared = SharedArrays(self.init_partition())
+        # the workers and the shared memory are released even if close() is never called
+        self.finalizer = weakref.finalize(self, VectorizedFlowParallel.stop_workers,
+                                          self.shared, self.workers, self.connections)
+        part_count = self.partition.part_count
+        barrier = multiprocessing.Barrier(part_count)
+        for part in range(part_count):
+            first, last = self.partition.get_range(part)
+            parent_connection, child_connection = multiprocessing.Pipe()
+            worker = multiprocessing.Process(target=partition_worker, daemon=True,
+                                             args=(self.shared.describe(), first, last, barrier, child_connection))
+            worker.start()
+            self.workers.append(worker)
+            self.connections.append(parent_connection)
+        self.run_statistics["parallel_workers"] = part_count
+        self.run_statistics["parallel_cut_links"] = self.partition.cut_edges
+        logging.info(f"{part_count} partitions, {self.partition.cut_edges} cut links")
+
+    @staticmethod
+    def stop_workers(shared, workers, connections):
+        for connection in connections:
+            try:
+                connection.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for worker in workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+        workers.clear()
+        connections.clear()
+        shared.close(unlink=True)
+
+    def close(self):
+        if self.finalizer is not None:
+            self.finalizer()
+            self.finalizer = None
+            self.shared = None
+
+    def run_steps(self, step_count):
+        if self.shared is None:
+            self.start_workers()
+        shared = self.shared.arrays
+        order, position = self.partition.order, self.partition.position
+        accumulate = self.cell_sums is not None
+        inputs = STATE_VECTORS + ["border_inflow"]
+        if accumulate:
+            np.take(self.cell_sums.vehicle_sum, order, out=shared["vehicle_sum"])
+            np.take(self.cell_sums.outflow_sum, order, out=shared["outflow_sum"])
+        for name in inputs:
+            np.take(getattr(self, name), order, out=shared[name])
+
+        for connection in self.connections:
+            connection.send((step_count, accumulate))
+        errors = [error for error in (connection.recv() for connection in self.connections) if error is not None]
+        if errors:
+            self.close()
+            raise RuntimeError("Partition worker failed:\n" + errors[0])
+
+        for name in STATE_VECTORS:
+            np.take(shared[name], position, out=getattr(self, name))
+        if accumulate:
+            np.take(shared["vehicle_sum"], position, out=self.cell_sums.vehicle_sum)
+            np.take(shared["outflow_sum"], position, out=self.cell_sums.outflow_sum)
+            self.cell_sums.add_steps(step_count)
+
+    def simulate(self, checkpoint_intervals=None, checkpoint_path=None):
+        try:
+            super().simulate(checkpoint_intervals, checkpoint_path)
+        finally:
+            self.close()
+
+    @staticmethod
+    def get_name():
+        return "Vectorized Calculation with Parallel Partitions"
@@ -8,94 +8,63 @@ import scipy.sparse as sparse
 
 
 class VectorSparse(vf.VectorFullMatrix):
+    COMPILED_NETWORK = True
 
-    def __init__(self, yaml_input):
-        super().__init__(yaml_input)
+    def __init__(self, yaml_input, config=None):
+        super().__init__(yaml_input, config)
 
     #    def create_segment_cells(self, key, values: dict):
     #        super().create_segment_cells(key, values)
 
     def create_adjacent_matrix(self):
-
-        # temp_adjacent_matrix = sparse.csr_matrix((len(self.cells), len(self.cells)), dtype=np.double)
-        row = []
-        col = []
-        data = []
+        cell_count = len(self.cells)
+
+        # links inside the segments: every cell except the last one of a segment flows into its next cell
+        last_cells = np.array([segment[self.LAST] for segment in self.segment_map.values()], dtype=np.int64)
+        inner_cells = np.ones(cell_count, dtype=bool)
+        inner_cells[last_cells] = False
+        col = np.flatnonzero(inner_cells)
+        row = col + 1
+
+        # links between the segments. A link can be given by the successor and by the predecessor list,
+        # the set keeps each (row, col) pair once
+        links = set()
         for segment in self.segment_map.values():
-            first = segment[self.FIRST]
-            last = segment[self.LAST]
-            for i in range(first, last):
-                row.append(i + 1)
-                col.append(i)
-                data.append(self.ADJACENT_FACTOR)
-
             if segment[self.SUCCESSORS]:
                 for i in segment[self.SUCCESSORS]:
-                    first_of_successor = self.segment_map[i][self.FIRST]
-                    if first_of_successor in row and last in col:
-                        continue
-                    row.append(first_of_successor)
-                    col.append(last)
-                    data.append(self.ADJACENT_FACTOR)
+                    links.add((self.segment_map[i][self.FIRST], segment[self.LAST]))
 
             if segment[self.PREDECESSORS] and len(segment[self.PREDECESSORS]) == 2:
                 for i in segment[self.PREDECESSORS]:
-                    last_of_predecessor = self.segment_map[i][self.LAST]
-                    if first in row and last_of_predecessor in col:
-                        continue
-                    row.append(first)
-                    col.append(last_of_predecessor)
-                    data.append(self.ADJACENT_FACTOR)
-        self.adjacent_matrix = sparse.csr_matrix((data, (row, col)), shape=(len(self.cells), len(self.cells)))
+                    links.add((segment[self.FIRST], self.segment_map[i][self.LAST]))
+        if links:
+            link_row, link_col = np.array(sorted(links), dtype=np.int64).T
+            row = np.concatenate((row, link_row))
+            col = np.concatenate((col, link_col))
+
+        data = np.full(len(row), self.ADJACENT_FACTOR)
+        self.adjacent_matrix = sparse.csr_matrix((data, (row, col)), shape=(cell_count, cell_count))
 
     def init_flows(self):
-        # print(ndarray.nonzero(adjacent_matrix))
+        topology = self.get_topology()
+        for i in topology.isolated_cells:
+            error = 'No allowed link found for cell ' + str(i)
+            raise Exception(error)
+
         for i in range(0, len(self.flow)):
-            link_found = False
-            cell_b = i
-            if not i in self.flow_dict:
-                self.flow_dict[i] = {}
-            if self.adjacent_matrix.getrow(i).count_nonzero() > 1:  # Merge
-                nonzero = self.adjacent_matrix.getrow(i).nonzero()
-
-                cell_a = nonzero[1][0]  # get first y coordinate
-                cell_c = nonzero[1][1]  # get second y coordinate
-                self.flow_dict[cell_a] = {}
-                self.flow_dict[cell_c] = {}
-                self.flow_dict[cell_a]['type'] = 'merge'
-                self.flow_dict[cell_c]['type'] = 'merge'
-                self.flow_dict[cell_c]['c'] = cell_a  # complementary for c is a
-                self.flow_dict[cell_a]['c'] = cell_c  # complementary for a is c
-                self.flow_dict[cell_c]['b'] = cell_b
-                self.flow_dict[cell_a]['b'] = cell_b
-                link_found = True
-
-            if self.adjacent_matrix.getcol(i).count_nonzero() > 1:  # Diverge
-                nonzero = self.adjacent_matrix.getcol(i).nonzero()
-                cell_a = nonzero[0][0]  # get first x coordinate
-                cell_c = nonzero[0][1]  # get second x coordinate
-                self.flow_dict[i]['type'] = 'diverge'
-                self.flow_dict[i]['a'] = cell_a
-                self.flow_dict[i]['c'] = cell_c
-                link_found = True
-
-            if self.adjacent_matrix.getcol(i).count_nonzero() == 1:  # ordinary
-
-                link_found = True
-                nonzero = self.adjacent_matrix.getcol(i).nonzero()
-                cell_a = nonzero[0][0]  # get value of row / x-coordinate
-                if not self.flow_dict[i]:  # other kind of link exists already
-                    self.flow_dict[i]['type'] = 'ord'
-                    self.flow_dict[i]['a'] = cell_a
-
-            if self.adjacent_matrix.getcol(i).count_nonzero() == 0 \
-                    and not self.adjacent_matrix.getrow(i).count_nonzero() == 0:  # Border Out Cell
-                link_found = True
-                self.flow_dict[i]['type'] = 'border'  # border out
-
-            if not link_found:
-                error = 'No allowed link found for cell ' + str(i)
-                raise Exception(error)
+            if topology.bool_merge[i]:
+                self.flow_dict[i] = {'type': 'merge',
+                                     'c': topology.merge_partner[i],  # complementary cell
+                                     'b': topology.merge_target[i]}  # merged cell
+            elif topology.bool_diverge[i]:
+                self.flow_dict[i] = {'type': 'diverge',
+                                     'a': topology.diverge_first[i],
+                                     'c': topology.diverge_second[i]}
+            elif topology.out_count[i] == 1:  # ordinary
+                self.flow_dict[i] = {'type': 'ord',
+                                     'a': topology.successor[i]}
+            elif topology.bool_border_out[i]:
+                self.flow_dict[i] = {'type': 'border'}  # border out
 
 
 def main():
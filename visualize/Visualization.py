@@ -79,13 +79,13 @@ class Visualization:
     def save_result_plots(simulation: SimulationInterface):
         logging.info("Saving result plots...")
         for plot in Visualization.plots:
-            plot.savefig(Settings.RESULT_PATH + datetime.now().strftime("%Y%m%d-%H%M") + ".png")
+            plot.savefig(simulation.settings.RESULT_PATH + datetime.now().strftime("%Y%m%d-%H%M") + ".png")
         return
 
     @staticmethod
     def plot_graphmap_segments(simulation: SimulationInterface):
-        results_dict = simulation.get_results_dict()
-        traffic_network = Visualization.build_graph(results_dict)
+        results = simulation.get_results()
+        traffic_network = Visualization.build_graph(results)
 
         pos = nx.spectral_layout(traffic_network)
         plt.clf()
@@ -97,21 +97,20 @@ class Visualization:
         ax.set_axis_off()
         # plt.draw()
         fignum = plt.get_fignums()
-        plt.savefig(Settings.RESULT_PATH + datetime.now().strftime("%Y%m%d-%H%M") + ".png")
+        plt.savefig(simulation.settings.RESULT_PATH + datetime.now().strftime("%Y%m%d-%H%M") + ".png")
 
     @staticmethod
     def build_graph(results):
         traffic_network = nx.DiGraph()
-        if not results:
+        if not results or len(results) < 2:
             return traffic_network
-        for node in results[1].keys():
-            traffic_network.add_node(node, traffic=results[1][node]['vehicles'])
+        for node in results.segment_ids:
+            traffic_network.add_node(node, traffic=results.segment_timestep(node, 1))
 
-        for time_step, data in results.items():
-            for node, segment_data in data.items():
-                if segment_data['successors']:
-                    for successor in segment_data['successors']:
-                        traffic_network.add_edge(node, successor)
+        # the network does not change over time
+        for node in results.segment_ids:
+            for successor in results.successors[node] or []:
+                traffic_network.add_edge(node, successor)
 
         return traffic_network
 
@@ -121,10 +120,8 @@ class Visualization:
         pass
         time_step = int(time_step) - 1
         # Calculate the average number of vehicles for each segment at the current time step
-        avg_traffic = {
-            node: np.divide(np.sum(results[time_step][node]['vehicles']), results[time_step][node]['max_vehicle']) * 100
-            for
-            node in results[time_step].keys()}
+        occupancy = results.segment_occupancy()[time_step]
+        avg_traffic = {node: occupancy[results.segment_index[node]] for node in results.segment_ids}
 
         # Update node colors based on the average traffic
         node_colors = [avg_traffic[node] for node in traffic_network.nodes]
@@ -148,13 +145,11 @@ class Visualization:
         # result_np should be in this form:
         # results = [[c1(0), c2(0),..., cn-1(0), cn(0)],[c1(1), c2(1),..., cn-1(1), cn(1)] ...]
         #             timestep 1                         timestep 2
-        results = simulation.get_results_np()
+        results = simulation.get_results()
         plots = []
-        print(simulation.get_segments())
-        for key, segment in simulation.get_segments().items():
-            plots = Visualization.plot_heatmap_timesteps(key, segment[SimulationInterface.LOG],
-                                                         segment[SimulationInterface.MAX_VEHICLE],
-                                                         segment[SimulationInterface.LANES])
+        for key in results.segment_ids:
+            plots = Visualization.plot_heatmap_timesteps(key, results.segment(key), results.max_vehicles(key),
+                                                         results.segment_lanes(key))
 
         return plots
 